@@ -1,65 +1,706 @@
 import os
 import io
 import json
-import dotenv
-import google.generativeai as genai
-from pypdf import PdfReader
+import mmap
+import hashlib
+import tempfile
+import sqlite3
+import re
+import math
+import asyncio
+import threading
+from collections import Counter
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from database import connect_db, create_tables, get_cached_response, put_cached_response
+from rate_limiter import default_rate_limiter
+from quiz_schema import QUIZ_RESPONSE_SCHEMA, MCQ_SECTION_SCHEMA, MIXED_SECTION_SCHEMA, parse_quiz, \
+                        parse_quiz_response
+from llm_backends import create_backend
 
-dotenv.load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Documents with fewer pages than this are extracted sequentially; below this size
+# the cost of starting worker processes outweighs the parallel speedup.
+PARALLEL_EXTRACTION_MIN_PAGES = 50
+DEFAULT_EXTRACTION_WORKERS = os.cpu_count() or 1
 
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in .env file. Please set it.")
+# Map-reduce summarization: texts longer than one chunk are split into chunks of
+# about SUMMARY_CHUNK_TOKENS tokens (overlapping by SUMMARY_CHUNK_OVERLAP_TOKENS),
+# summarized with at most SUMMARY_CONCURRENCY concurrent calls, then combined.
+SUMMARY_CHUNK_TOKENS = 8000
+SUMMARY_CHUNK_OVERLAP_TOKENS = 200
+SUMMARY_CONCURRENCY = 4
+# Cap on map rounds (summarizing the chunk summaries again) before the final reduce
+SUMMARY_MAX_MAP_ROUNDS = 3
+# Versions of the summary and quiz prompt templates. Bump them whenever a prompt
+# changes so that responses cached for the old prompt are no longer used.
+SUMMARY_PROMPT_VERSION = 1
+QUIZ_PROMPT_VERSION = 1
 
-genai.configure(api_key=GEMINI_API_KEY)
+# Quiz sections generated by separate concurrent calls in parallel quiz mode:
+# (question type, key in the quiz JSON, number of questions, schema, prompt instructions)
+QUIZ_SECTIONS = [
+    ("mcqs", "mcqs", 10, MCQ_SECTION_SCHEMA,
+     """Create 10 Multiple Choice Questions (MCQs). Each MCQ should have 4 options (A, B, C, D) and a single correct answer.
+        Format them as a JSON object with one key, "mcqs": a list of MCQ objects. Each MCQ object must have:
+        - "question": The question text.
+        - "options": A list of 4 strings, e.g., ["A. Option 1", "B. Option 2", "C. Option 3", "D. Option 4"].
+        - "correct_answer": The letter (A, B, C, or D) corresponding to the correct option."""),
+    ("true_false", "mixed_questions", 5, MIXED_SECTION_SCHEMA,
+     """Create 5 True/False Questions. Each question should have 'True' or 'False' as the correct answer.
+        Format them as a JSON object with one key, "mixed_questions": a list of question objects. Each question object must have:
+        - "type": "true_false".
+        - "question": The question text.
+        - "correct_answer": "True" or "False"."""),
+    ("fill_in_the_blank", "mixed_questions", 5, MIXED_SECTION_SCHEMA,
+     """Create 5 Fill-in-the-Blank Questions. Each question should have exactly one blank represented by '_______' and a single correct answer for the blank.
+        Format them as a JSON object with one key, "mixed_questions": a list of question objects. Each question object must have:
+        - "type": "fill_in_the_blank".
+        - "question": The question text.
+        - "correct_answer": The word or phrase for the blank."""),
+]
+
+# Quiz sources: the full text, the summary only, or the summary plus the source
+# passages that best match it. The smaller sources cut the quiz call's input tokens.
+QUIZ_SOURCES = ("full", "summary", "summary_passages")
+QUIZ_SOURCE_PASSAGES = 8
+QUIZ_PASSAGE_TOKENS = 300
+
+# Rough characters-per-token ratio used to size chunks without a tokenizer round trip
+CHARS_PER_TOKEN = 4
+
+# Content-defined summary chunks are at least 1/CONTENT_CHUNK_MIN_FRACTION and on
+# average 1/CONTENT_CHUNK_TARGET_FRACTION of the maximum chunk size.
+CONTENT_CHUNK_MIN_FRACTION = 4
+CONTENT_CHUNK_TARGET_FRACTION = 2
+
+def estimate_tokens(text):
+    """Estimates the number of model tokens in `text`."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def split_into_chunks(text, chunk_tokens, overlap_tokens=0):
+    """
+    Splits text into chunks of at most about `chunk_tokens` tokens, each starting
+    `overlap_tokens` tokens before the end of the previous one. Chunks break at
+    paragraph, line or word boundaries where possible.
+    """
+    chunk_chars = max(1, chunk_tokens * CHARS_PER_TOKEN)
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, chunk_chars // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            # Prefer the last natural break in the second half of the window
+            for separator in ("\n\n", "\n", " "):
+                cut = text.rfind(separator, start + chunk_chars // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        next_start = end - overlap_chars
+        if overlap_chars:
+            # Start the overlap on a word boundary
+            space = text.find(" ", next_start, end)
+            if space != -1:
+                next_start = space + 1
+        start = max(next_start, start + 1)
+    return chunks
+
+def _line_hash(line):
+    """Maps a line to a deterministic pseudo-random number in [0, 1)."""
+    return int.from_bytes(hashlib.blake2b(line.encode('utf-8'), digest_size=8).digest(), 'big') / 2 ** 64
+
+def split_into_content_defined_chunks(text, chunk_tokens, overlap_tokens=0):
+    """
+    Splits text into chunks of at most about `chunk_tokens` tokens at line breaks
+    chosen by the content of the lines themselves, so an edit only changes the
+    chunks around it: the chunks before and after an edited passage come out
+    identical and their cached summaries are reused. Each chunk after the first
+    starts with the last `overlap_tokens` tokens of the previous one.
+    """
+    chunk_chars = max(1, chunk_tokens * CHARS_PER_TOKEN)
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, chunk_chars // 2)
+    body_chars = chunk_chars - overlap_chars
+    min_chars = body_chars // CONTENT_CHUNK_MIN_FRACTION
+    target_chars = max(1, body_chars // CONTENT_CHUNK_TARGET_FRACTION)
+    bodies = []
+    lines, size = [], 0
+    for line in text.splitlines(keepends=True):
+        if len(line) > body_chars:
+            # A single line too long for a chunk is split by size
+            if lines:
+                bodies.append("".join(lines))
+                lines, size = [], 0
+            bodies.extend(split_into_chunks(line, body_chars // CHARS_PER_TOKEN))
+            continue
+        if size + len(line) > body_chars:
+            bodies.append("".join(lines))
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line)
+        # End the chunk with probability proportional to the line length, which
+        # gives chunks of about target_chars on average whatever the line lengths
+        if size >= min_chars and _line_hash(line) < len(line) / target_chars:
+            bodies.append("".join(lines))
+            lines, size = [], 0
+    if lines:
+        bodies.append("".join(lines))
+
+    chunks = bodies[:1]
+    for previous, body in zip(bodies, bodies[1:]):
+        overlap = previous[len(previous) - overlap_chars:] if overlap_chars else ""
+        # Start the overlap on a word boundary
+        space = overlap.find(" ")
+        if space != -1:
+            overlap = overlap[space + 1:]
+        chunks.append(overlap + body)
+    return chunks
+
+def _terms(text):
+    return re.findall(r"[a-z0-9]{3,}", text.lower())
+
+def select_passages(text, query, top_k=QUIZ_SOURCE_PASSAGES, passage_tokens=QUIZ_PASSAGE_TOKENS):
+    """
+    Splits text into passages of about `passage_tokens` tokens and returns the
+    `top_k` passages that best match `query` (TF-IDF term overlap), in document order.
+    """
+    passages = split_into_chunks(text, passage_tokens)
+    if len(passages) <= top_k:
+        return passages
+    passage_terms = [Counter(_terms(passage)) for passage in passages]
+    document_frequency = Counter(term for terms in passage_terms for term in terms)
+    query_terms = Counter(_terms(query))
+    def score(terms):
+        return sum(weight * (1 + math.log(terms[term])) * math.log(len(passages) / document_frequency[term])
+                   for term, weight in query_terms.items() if term in terms)
+    ranked = sorted(range(len(passages)), key=lambda i: score(passage_terms[i]), reverse=True)[:top_k]
+    return [passages[i] for i in sorted(ranked)]
+
+class _BufferStream(io.RawIOBase):
+    """
+    Read-only, seekable stream over a bytes-like buffer (bytes, memoryview, ...).
+    Reads slice the underlying buffer, so the document is never copied as a whole.
+    """
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("Negative seek position.")
+        self._pos = pos
+        return pos
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        if end <= self._pos:
+            return b""
+        data = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+@contextlib.contextmanager
+def _open_reader(source, use_mmap=False):
+    """
+    Opens a PdfReader over a file path or a bytes-like buffer.
+    With `use_mmap`, a path is mapped read-only instead of being read into memory:
+    only the pages pypdf touches become resident, and processes reading the same
+    file share the OS page cache.
+    """
+    with contextlib.ExitStack() as stack:
+        if isinstance(source, str) and use_mmap:
+            pdf_file = stack.enter_context(open(source, 'rb'))
+            mapped = stack.enter_context(mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ))
+            source = stack.enter_context(memoryview(mapped))
+        if not isinstance(source, str):
+            source = stack.enter_context(contextlib.closing(_BufferStream(source)))
+        # Imported on first use to keep `import agent` fast
+        from pypdf import PdfReader
+        yield PdfReader(source)
+
+def _extract_pages(source, page_indices, use_mmap=False):
+    """
+    Extracts the text of the pages at `page_indices` (0-based) in a worker process.
+    `source` is a file path or the raw PDF bytes; each worker opens its own reader.
+    """
+    with _open_reader(source, use_mmap) as reader:
+        return [reader.pages[i].extract_text() for i in page_indices]
+
+@contextlib.contextmanager
+def _spill_to_temp_file(buffer):
+    """Writes a bytes-like buffer to a temporary file and yields its path; the file is removed afterwards."""
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+        temp_file.write(buffer)
+    try:
+        yield temp_file.name
+    finally:
+        os.remove(temp_file.name)
+
+# Keys pointing back up the document tree; following them would hash the whole document
+_FINGERPRINT_SKIPPED_KEYS = {"/Parent", "/P"}
+
+def _object_digest(obj, memo):
+    """
+    Returns a SHA-256 digest of a PDF object and everything it references
+    (dictionaries, arrays and stream data, resolved recursively). Streams are
+    hashed as stored, together with their /Filter and /DecodeParms entries, so
+    images are never decoded.
+    `memo` maps indirect object numbers to digests, so objects shared between
+    pages, such as embedded fonts, are hashed once per document.
+    """
+    from pypdf.generic import IndirectObject, DictionaryObject, ArrayObject, StreamObject
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key in memo:
+            # None marks an object still being hashed: a reference cycle
+            return memo[key] or f"cycle:{key}".encode()
+        memo[key] = None
+        memo[key] = _object_digest(obj.get_object(), memo)
+        return memo[key]
+    digest = hashlib.sha256()
+    if isinstance(obj, DictionaryObject):
+        digest.update(b"dict")
+        for name in sorted(obj):
+            if name not in _FINGERPRINT_SKIPPED_KEYS:
+                digest.update(name.encode() + _object_digest(obj.raw_get(name), memo))
+        if isinstance(obj, StreamObject):
+            # The encoded bytes: decoding may need external tools (e.g. JBIG2) or hit size limits
+            digest.update(b"stream" + obj._data)
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"array")
+        for item in obj:
+            digest.update(_object_digest(item, memo))
+    else:
+        digest.update(type(obj).__name__.encode() + repr(obj).encode())
+    return digest.digest()
+
+def page_fingerprint(page, memo=None):
+    """
+    Returns the SHA-256 hex digest of what a page draws: its content stream and
+    its resources (fonts with their encodings and ToUnicode maps, Form XObjects
+    with their own resources, ...), resolved recursively. Pages with the same
+    fingerprint are drawn from identical inputs, so the stored text of one can be
+    reused for the other without extracting it again. Pass the same `memo` dict
+    for all pages of a document to hash shared resources only once.
+    """
+    memo = {} if memo is None else memo
+    digest = hashlib.sha256()
+    if "/Contents" in page:
+        digest.update(_object_digest(page.raw_get("/Contents"), memo))
+    # Resources may be inherited from an ancestor page tree node
+    node = page
+    while "/Resources" not in node and "/Parent" in node:
+        node = node["/Parent"].get_object()
+    if "/Resources" in node:
+        digest.update(_object_digest(node.raw_get("/Resources"), memo))
+    return digest.hexdigest()
 
 class StudyAgent:
-    def __init__(self, model_name='gemini-2.5-flash'): # Using gemini-pro for text generation as per common practice, flash is good for chat
-        self.model = genai.GenerativeModel(model_name)
+    def __init__(self, model_name='gemini-2.5-flash', extraction_workers=DEFAULT_EXTRACTION_WORKERS, use_mmap=False,
+                 summary_chunk_tokens=SUMMARY_CHUNK_TOKENS, summary_chunk_overlap_tokens=SUMMARY_CHUNK_OVERLAP_TOKENS,
+                 summary_concurrency=SUMMARY_CONCURRENCY, use_cache=True, rate_limiter=None,
+                 structured_quiz=True, parallel_quiz=False, backend=None, db=None): # Using gemini-pro for text generation as per common practice, flash is good for chat
+        # The backend defaults to the one selected by STUDY_AGENT_BACKEND (Gemini unless set)
+        self.backend = backend or create_backend(model_name)
+        self.model_name = self.backend.model_name
+        self.use_cache = use_cache
+        # Connection pool (see database.ConnectionPool) for the response cache;
+        # without one, each cache access opens its own connection
+        self.db = db
+        # Without a pool, the schema is ensured on the first cache access
+        self._schema_ready = db is not None
+        self._schema_lock = threading.Lock()
+        # Ask the model for schema-constrained JSON quizzes instead of free text
+        self.structured_quiz = structured_quiz
+        # Generate each quiz section with its own concurrent call
+        self.parallel_quiz = parallel_quiz
+        # All agents share one limiter by default so they respect a single API quota
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        self.extraction_workers = extraction_workers
+        self.use_mmap = use_mmap
+        self.summary_chunk_tokens = summary_chunk_tokens
+        self.summary_chunk_overlap_tokens = summary_chunk_overlap_tokens
+        self.summary_concurrency = summary_concurrency
 
-    def extract_text_from_pdf(self, pdf_file_path):
+    def iter_pages(self, pdf_file_path, workers=None, use_mmap=None):
         """
-        Extracts text from a PDF file.
-        Expects a file path or a file-like object.
+        Yields (page_number, text) tuples for a PDF file, in page order.
+        Expects a file path, an in-memory buffer (bytes, bytearray, memoryview)
+        or a file-like object. Page numbers start at 1.
+        Buffers and in-memory files (e.g. st.uploaded_file) are read in place
+        without copying the document. With `use_mmap` (defaults to `self.use_mmap`),
+        file paths are memory-mapped instead of read into memory.
+        Large documents are split into page ranges and extracted by a pool of
+        `workers` processes (defaults to `self.extraction_workers`); a buffer is
+        then written once to a temporary file that the workers memory-map.
+        Raises on invalid input or extraction errors.
         """
-        try:
+        for page_number, page_text, _ in self._iter_pages(pdf_file_path, workers, use_mmap):
+            yield page_number, page_text
+
+    def iter_pages_incremental(self, pdf_file_path, known_pages, workers=None, use_mmap=None):
+        """
+        Yields (page_number, text, fingerprint) tuples like `iter_pages`, for
+        re-uploads of a revised document. `known_pages` maps page fingerprints (see
+        `page_fingerprint`) to text, e.g. the pages stored for the previous version;
+        pages with a known fingerprint reuse that text and only new or changed
+        pages are extracted.
+        """
+        yield from self._iter_pages(pdf_file_path, workers, use_mmap, known_pages)
+
+    def _iter_pages(self, pdf_file_path, workers, use_mmap, known_pages=None):
+        """Opens the PDF and yields (page_number, text, fingerprint) tuples; fingerprints are None without `known_pages`."""
+        use_mmap = self.use_mmap if use_mmap is None else use_mmap
+        # The stack releases our views once iteration ends, so the caller's
+        # buffer can be resized or freed again
+        with contextlib.ExitStack() as stack:
             if isinstance(pdf_file_path, str): # Path to file
-                reader = PdfReader(pdf_file_path)
-            elif hasattr(pdf_file_path, 'read'): # File-like object (e.g., from st.uploaded_file)
-                reader = PdfReader(io.BytesIO(pdf_file_path.read()))
+                source = pdf_file_path
+            elif isinstance(pdf_file_path, (bytes, bytearray, memoryview)): # In-memory buffer
+                source = stack.enter_context(memoryview(pdf_file_path))
+            elif hasattr(pdf_file_path, 'getbuffer'): # In-memory file (e.g., st.uploaded_file, io.BytesIO)
+                source = stack.enter_context(pdf_file_path.getbuffer())
+            elif hasattr(pdf_file_path, 'read'): # Any other file-like object
+                source = stack.enter_context(memoryview(pdf_file_path.read()))
             else:
-                raise TypeError("pdf_file_path must be a string path or a file-like object.")
+                raise TypeError("pdf_file_path must be a string path, a bytes-like buffer or a file-like object.")
+            reader = stack.enter_context(_open_reader(source, use_mmap))
+            yield from self._iter_reader_pages(reader, source, workers, use_mmap, known_pages)
 
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+    def _iter_reader_pages(self, reader, source, workers, use_mmap, known_pages=None):
+        """Yields (page_number, text, fingerprint) tuples from an open reader, extracting only unknown pages."""
+        if known_pages is None:
+            fingerprints = [None] * len(reader.pages)
+            pending = list(range(len(reader.pages)))
+        else:
+            memo = {}
+            fingerprints = [self._page_fingerprint_or_none(page, page_number, memo)
+                            for page_number, page in enumerate(reader.pages, start=1)]
+            pending = [index for index, fingerprint in enumerate(fingerprints)
+                       if fingerprint is None or fingerprint not in known_pages]
+        with contextlib.closing(self._iter_extracted_pages(reader, source, pending, workers, use_mmap)) as texts:
+            for page_number, fingerprint in enumerate(fingerprints, start=1):
+                if fingerprint is not None and fingerprint in known_pages:
+                    yield page_number, known_pages[fingerprint], fingerprint
+                else:
+                    yield page_number, next(texts), fingerprint
+
+    def _page_fingerprint_or_none(self, page, page_number, memo):
+        """Returns the page's fingerprint, or None (the page is then extracted) if it cannot be computed."""
+        try:
+            return page_fingerprint(page, memo)
+        except Exception as e:
+            print(f"Error fingerprinting page {page_number}: {e}")
+            return None
+
+    def _iter_extracted_pages(self, reader, source, page_indices, workers, use_mmap):
+        """Yields the text of the pages at `page_indices` in order, in parallel for many pages."""
+        workers = workers or self.extraction_workers
+        if workers <= 1 or len(page_indices) < PARALLEL_EXTRACTION_MIN_PAGES:
+            for index in page_indices:
+                yield reader.pages[index].extract_text()
+            return
+
+        # Split the pages into one contiguous batch per worker
+        step = -(-len(page_indices) // workers)
+        batches = [page_indices[start:start + step] for start in range(0, len(page_indices), step)]
+        with contextlib.ExitStack() as stack:
+            if not isinstance(source, str):
+                # Sending the buffer to the workers would pickle a full copy per task;
+                # spill it to a temporary file once and let every worker map that file
+                source = stack.enter_context(_spill_to_temp_file(source))
+                use_mmap = True
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=len(batches)))
+            results = executor.map(_extract_pages,
+                                   [source] * len(batches),
+                                   batches,
+                                   [use_mmap] * len(batches))
+            for page_texts in results:
+                yield from page_texts
+
+    def extract_text_from_pdf(self, pdf_file_path, workers=None, use_mmap=None):
+        """
+        Extracts text from a PDF file.
+        Expects a file path, a bytes-like buffer or a file-like object.
+        Thin wrapper joining the pages yielded by `iter_pages`.
+        """
+        try:
+            return "".join(page_text + "\n" for _, page_text in self.iter_pages(pdf_file_path, workers, use_mmap))
         except Exception as e:
             print(f"Error extracting text from PDF: {e}")
             return None
 
-    def summarize_text(self, text, style="academic"):
+    def _generate(self, prompt, response_schema=None):
         """
-        Generates a summary of the provided text using the Gemini model.
+        Sends a prompt to the model backend and returns the response text.
+        With `response_schema`, the model is constrained to JSON matching the schema.
+        The call goes through the rate limiter, which retries throttled and transient failures.
         """
-        prompt = f"""You are an expert study notes summarizer. Summarize the following PDF text in {style} style. Focus on key concepts, examples, and important details. Use headings, bullet points, or numbered lists. Avoid placeholder text. Return only the summary text.
-        PDF Text:
-        {text}
+        return self.rate_limiter.call(self.backend.generate, prompt, response_schema, tokens=estimate_tokens(prompt))
+
+    def _generate_stream(self, prompt):
+        """Sends a prompt to the model backend and yields the response text as it arrives."""
+        yield from self.rate_limiter.stream(self.backend.generate_stream, prompt, tokens=estimate_tokens(prompt))
+
+    def _cache_key(self, prompt_version, style, text):
+        """Builds the response cache key for an input text."""
+        return (self.model_name, prompt_version, style, hashlib.sha256(text.encode('utf-8')).hexdigest())
+
+    @contextlib.contextmanager
+    def _db_connection(self):
+        """Yields the pool's write connection if the agent has a pool, otherwise a short-lived connection."""
+        if self.db is not None:
+            # Cache lookups also refresh the entry's access time, so they need the writer
+            with self.db.writer() as conn:
+                yield conn
+            return
+        conn = connect_db()
+        try:
+            if not self._schema_ready:
+                with self._schema_lock:
+                    if not self._schema_ready:
+                        create_tables(conn)
+                        self._schema_ready = True
+            yield conn
+        finally:
+            conn.close()
+
+    def _cache_get(self, cache_key):
+        """Looks up a cached response; cache errors are reported and treated as a miss."""
+        if not self.use_cache:
+            return None
+        try:
+            with self._db_connection() as conn:
+                return get_cached_response(conn, *cache_key)
+        except sqlite3.Error as e:
+            print(f"Error reading response cache: {e}")
+            return None
+
+    def _cache_put(self, cache_key, response_text):
+        """Stores a response in the cache; cache errors are reported and ignored."""
+        if not self.use_cache:
+            return
+        try:
+            with self._db_connection() as conn:
+                put_cached_response(conn, *cache_key, response_text)
+        except sqlite3.Error as e:
+            print(f"Error writing response cache: {e}")
+
+    def summarize_text(self, text, style="academic", map_reduce=None, chunk_tokens=None,
+                       overlap_tokens=None, concurrency=None):
+        """
+        Generates a summary of the provided text using the Gemini model.
+        Texts longer than one chunk are summarized map-reduce style: chunks are
+        summarized concurrently and the partial summaries are combined into the
+        final summary. `map_reduce` forces the mode on or off (default: automatic);
+        the chunking parameters default to the agent's settings.
+        Summaries of previously seen texts are served from the response cache, and
+        in map-reduce mode so are the summaries of chunks seen before (chunk
+        boundaries follow the content, so a revised document only regenerates the
+        chunks around its edits).
         """
+        map_reduce, chunk_tokens, overlap_tokens, concurrency = self._summary_settings(
+            text, map_reduce, chunk_tokens, overlap_tokens, concurrency)
+        cache_key = self._cache_key(SUMMARY_PROMPT_VERSION, style, text)
+        cached_summary = self._cache_get(cache_key)
+        if cached_summary is not None:
+            return cached_summary
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            summary = self._summarize(text, style, map_reduce, chunk_tokens, overlap_tokens, concurrency)
         except Exception as e:
             print(f"Error generating summary: {e}")
             return None
+        self._cache_put(cache_key, summary)
+        return summary
+
+    def _summary_settings(self, text, map_reduce, chunk_tokens, overlap_tokens, concurrency):
+        """Fills in unset summarization parameters from the agent's settings."""
+        chunk_tokens = chunk_tokens or self.summary_chunk_tokens
+        overlap_tokens = self.summary_chunk_overlap_tokens if overlap_tokens is None else overlap_tokens
+        concurrency = concurrency or self.summary_concurrency
+        if map_reduce is None:
+            map_reduce = estimate_tokens(text) > chunk_tokens
+        return map_reduce, chunk_tokens, overlap_tokens, concurrency
+
+    def summarize_text_stream(self, text, style="academic", map_reduce=None, chunk_tokens=None,
+                              overlap_tokens=None, concurrency=None):
+        """
+        Streaming variant of `summarize_text`: yields the summary in pieces as the
+        model produces them. In map-reduce mode the chunk summaries are generated
+        first and only the final combining call is streamed.
+        The complete summary is stored in the response cache once streaming ends.
+        Raises on model errors.
+        """
+        map_reduce, chunk_tokens, overlap_tokens, concurrency = self._summary_settings(
+            text, map_reduce, chunk_tokens, overlap_tokens, concurrency)
+        cache_key = self._cache_key(SUMMARY_PROMPT_VERSION, style, text)
+        cached_summary = self._cache_get(cache_key)
+        if cached_summary is not None:
+            yield cached_summary
+            return
+        prompt = self._final_summary_prompt(text, style, map_reduce, chunk_tokens, overlap_tokens, concurrency)
+        pieces = []
+        for piece in self._generate_stream(prompt):
+            pieces.append(piece)
+            yield piece
+        self._cache_put(cache_key, "".join(pieces))
+
+    def _summarize(self, text, style, map_reduce, chunk_tokens, overlap_tokens, concurrency):
+        """Generates a summary in a single call or map-reduce style; raises on model errors."""
+        return self._generate(self._final_summary_prompt(text, style, map_reduce, chunk_tokens, overlap_tokens, concurrency))
+
+    def _final_summary_prompt(self, text, style, map_reduce, chunk_tokens, overlap_tokens, concurrency):
+        """
+        Builds the prompt that produces the final summary. In map-reduce mode this
+        first summarizes the chunks concurrently and returns the combining prompt.
+        """
+        if not map_reduce:
+            return self._summary_prompt(text, style)
 
-    def generate_quiz(self, pdf_text):
+        partial_text = text
+        for _ in range(SUMMARY_MAX_MAP_ROUNDS):
+            input_tokens = estimate_tokens(partial_text)
+            chunks = split_into_content_defined_chunks(partial_text, chunk_tokens, overlap_tokens)
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                partial_summaries = list(executor.map(
+                    lambda chunk_number, chunk: self._summarize_chunk(chunk, chunk_number, len(chunks), style),
+                    range(1, len(chunks) + 1), chunks))
+            partial_text = "\n\n".join(partial_summaries)
+            # Reduce once the partial summaries fit in a single prompt, or as soon as a
+            # round fails to shrink the text (another round would only cost more calls)
+            if len(chunks) == 1 or estimate_tokens(partial_text) <= chunk_tokens \
+                    or estimate_tokens(partial_text) >= input_tokens:
+                break
+        return self._reduce_summary_prompt(partial_text, style)
+
+    def _chunk_cache_key(self, chunk, style):
+        """
+        Cache key for the summary of one chunk. It depends only on the chunk text,
+        not its position, so unchanged chunks of a revised document hit the cache.
+        """
+        return self._cache_key(SUMMARY_PROMPT_VERSION, f"chunk:{style}", chunk)
+
+    def _summarize_chunk(self, chunk, chunk_number, chunk_count, style):
+        """Summarizes one chunk in the map phase, reusing the cached summary of an identical chunk."""
+        cache_key = self._chunk_cache_key(chunk, style)
+        chunk_summary = self._cache_get(cache_key)
+        if chunk_summary is None:
+            chunk_summary = self._generate(self._chunk_summary_prompt(chunk, chunk_number, chunk_count, style))
+            self._cache_put(cache_key, chunk_summary)
+        return chunk_summary
+
+    def _summary_prompt(self, text, style):
+        return f"""You are an expert study notes summarizer. Summarize the following PDF text in {style} style. Focus on key concepts, examples, and important details. Use headings, bullet points, or numbered lists. Avoid placeholder text. Return only the summary text.
+        PDF Text:
+        {text}
+        """
+
+    def _chunk_summary_prompt(self, chunk, chunk_number, chunk_count, style):
+        return f"""You are an expert study notes summarizer. The following is part {chunk_number} of {chunk_count} of a PDF text. Summarize it in {style} style, keeping every key concept, example, and important detail it contains so the parts can later be combined into one summary. Avoid placeholder text. Return only the summary text.
+        PDF Text (part {chunk_number} of {chunk_count}):
+        {chunk}
+        """
+
+    def _reduce_summary_prompt(self, partial_summaries, style):
+        return f"""You are an expert study notes summarizer. The following are summaries of consecutive parts of a PDF text. Combine them into a single summary of the whole document in {style} style. Focus on key concepts, examples, and important details, and remove repetition between parts. Use headings, bullet points, or numbered lists. Avoid placeholder text. Return only the summary text.
+        Part Summaries:
+        {partial_summaries}
+        """
+
+    def quiz_source_text(self, pdf_text, summary_text, source="full"):
+        """
+        Builds the study material a quiz is generated from: the full text, the
+        summary only, or the summary plus the top-ranked source passages.
+        """
+        if source == "full":
+            return pdf_text
+        if source == "summary":
+            return summary_text
+        if source == "summary_passages":
+            passages = select_passages(pdf_text, summary_text)
+            return "Summary:\n" + summary_text + "\n\nKey Source Passages:\n" + "\n\n".join(passages)
+        raise ValueError(f"Unknown quiz source '{source}'. Expected one of {QUIZ_SOURCES}.")
+
+    def generate_quiz(self, pdf_text, parallel=None):
         """
         Generates quiz questions (MCQ, True/False, Fill-in-the-Blank) from the given text
         using the Gemini model and returns them in a structured JSON format.
+        With `parallel` (defaults to `self.parallel_quiz`), each question type is
+        generated by its own concurrent call and the results are merged, so the
+        wall-clock time follows the slowest section instead of the whole output.
+        Quizzes for previously seen texts are served from the response cache.
         """
+        parallel = self.parallel_quiz if parallel is None else parallel
+        cache_key = self._cache_key(QUIZ_PROMPT_VERSION, "sections" if parallel else "default", pdf_text)
+        cached_quiz = self._cache_get(cache_key)
+        if cached_quiz is not None:
+            return json.loads(cached_quiz)
+
+        if parallel:
+            with ThreadPoolExecutor(max_workers=len(QUIZ_SECTIONS)) as executor:
+                futures = [executor.submit(self._generate_quiz_section, pdf_text, section) for section in QUIZ_SECTIONS]
+            section_results = []
+            for section, future in zip(QUIZ_SECTIONS, futures):
+                try:
+                    section_results.append(future.result())
+                except Exception as e:
+                    print(f"Error generating {section[0]} quiz questions: {e}")
+                    section_results.append(None)
+            quiz_data = self._merge_quiz_sections(section_results)
+            # Only complete quizzes are cached; a partial one is retried next time
+            if quiz_data and all(section_results):
+                self._cache_put(cache_key, json.dumps(quiz_data))
+            return quiz_data
+
+        response_text = None
+        try:
+            response_text = self._generate(self._quiz_prompt(pdf_text), self._quiz_response_schema())
+            quiz_data, complete = self._parse_quiz(response_text)
+            # Only complete quizzes are cached; a salvaged one is retried next time
+            if complete:
+                self._cache_put(cache_key, json.dumps(quiz_data))
+            return quiz_data
+
+        except json.JSONDecodeError as e:
+            print(f"Error decoding quiz JSON from Gemini response: {e}")
+            print(f"Raw response text: {response_text}")
+            return None
+        except Exception as e:
+            print(f"Error generating quiz: {e}")
+            return None
+
+    def _quiz_prompt(self, pdf_text):
         # Using a more detailed prompt to ensure structured JSON output
-        prompt = f"""
+        return f"""
         You are an expert quiz generator. Based on the following study material, create a comprehensive quiz.
         The quiz should contain:
         1.  **10 Multiple Choice Questions (MCQs)**: Each MCQ should have 4 options (A, B, C, D) and a single correct answer.
@@ -84,32 +725,198 @@ class StudyAgent:
         Study Material:
         {pdf_text}
         """
+
+    def _quiz_section_prompt(self, pdf_text, section):
+        instructions = section[4]
+        return f"""
+        You are an expert quiz generator. Based on the following study material, create part of a quiz.
+        {instructions}
+
+        Ensure the questions cover important concepts, definitions, and facts from the material.
+        Do NOT include any introductory or concluding remarks, only the JSON output.
+
+        Study Material:
+        {pdf_text}
+        """
+
+    def _generate_quiz_section(self, pdf_text, section):
+        """Generates the questions of one quiz section; raises if none are usable."""
+        response_text = self._generate(self._quiz_section_prompt(pdf_text, section),
+                                       section[3] if self.structured_quiz else None)
+        return self._section_questions(response_text, section)
+
+    def _section_questions(self, response_text, section):
+        """Extracts the valid questions of one section's type from a section response."""
+        question_type, key, _, _, _ = section
+        questions = parse_quiz(response_text)[key]
+        if key == "mixed_questions":
+            questions = [question for question in questions if question["type"] == question_type]
+        if not questions:
+            raise ValueError(f"No valid {question_type} questions in response.")
+        return questions
+
+    def _merge_quiz_sections(self, section_results):
+        """
+        Merges per-section question lists (None for failed sections) into the quiz
+        structure. Returns None if no section produced questions.
+        """
+        quiz_data = {"mcqs": [], "mixed_questions": []}
+        for (_, key, _, _, _), questions in zip(QUIZ_SECTIONS, section_results):
+            if questions:
+                quiz_data[key].extend(questions)
+        if not quiz_data["mcqs"] and not quiz_data["mixed_questions"]:
+            print("Error generating quiz: no quiz section could be generated.")
+            return None
+        return quiz_data
+
+    def _quiz_response_schema(self):
+        return QUIZ_RESPONSE_SCHEMA if self.structured_quiz else None
+
+    def _parse_quiz(self, response_text):
+        """
+        Parses and validates the quiz JSON returned by the model. Sloppy or truncated
+        output is repaired and its valid questions kept; raises if nothing is usable.
+        Returns (quiz, complete); `complete` is False for repaired or partial quizzes.
+        """
+        return parse_quiz_response(response_text)
+
+class AsyncStudyAgent(StudyAgent):
+    """
+    Asynchronous counterpart of StudyAgent. Model calls are awaited instead of
+    blocking, so the summary and the quiz for a text can be generated concurrently.
+    All coroutines are cancellable; cancelling one abandons its in-flight calls.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def run(self, coro):
+        """
+        Runs a coroutine on the agent's event loop thread and waits for its result.
+        The loop lives as long as the agent, so the async Gemini client stays bound
+        to a single loop across calls (e.g. Streamlit reruns).
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="study-agent-loop", daemon=True).start()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
         try:
-            response = self.model.generate_content(prompt)
-            # Gemini sometimes adds markdown ```json ... ``` wrapper
-            quiz_json_str = response.text.strip()
-            if quiz_json_str.startswith("```json"):
-                quiz_json_str = quiz_json_str[len("```json"):
-].strip()
-            if quiz_json_str.endswith("```"):
-                quiz_json_str = quiz_json_str[:-len("```")].strip()
-                
-            quiz_data = json.loads(quiz_json_str)
-            
-            # Basic validation of the quiz structure
-            if "mcqs" not in quiz_data or "mixed_questions" not in quiz_data:
-                raise ValueError("Quiz data missing 'mcqs' or 'mixed_questions' keys.")
-            
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def _generate_async(self, prompt, response_schema=None):
+        """Sends a prompt to the model backend through the rate limiter without blocking."""
+        return await self.rate_limiter.call_async(self.backend.generate_async, prompt, response_schema,
+                                                  tokens=estimate_tokens(prompt))
+
+    async def summarize_text_async(self, text, style="academic", map_reduce=None, chunk_tokens=None,
+                                   overlap_tokens=None, concurrency=None):
+        """Async version of `summarize_text`; chunk summaries run as concurrent tasks."""
+        map_reduce, chunk_tokens, overlap_tokens, concurrency = self._summary_settings(
+            text, map_reduce, chunk_tokens, overlap_tokens, concurrency)
+        cache_key = self._cache_key(SUMMARY_PROMPT_VERSION, style, text)
+        cached_summary = await asyncio.to_thread(self._cache_get, cache_key)
+        if cached_summary is not None:
+            return cached_summary
+        try:
+            summary = await self._summarize_async(text, style, map_reduce, chunk_tokens, overlap_tokens, concurrency)
+        except Exception as e:
+            print(f"Error generating summary: {e}")
+            return None
+        await asyncio.to_thread(self._cache_put, cache_key, summary)
+        return summary
+
+    async def _summarize_async(self, text, style, map_reduce, chunk_tokens, overlap_tokens, concurrency):
+        """Generates a summary in a single call or map-reduce style; raises on model errors."""
+        if not map_reduce:
+            return await self._generate_async(self._summary_prompt(text, style))
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def summarize_chunk(chunk, chunk_number, chunk_count):
+            cache_key = self._chunk_cache_key(chunk, style)
+            chunk_summary = await asyncio.to_thread(self._cache_get, cache_key)
+            if chunk_summary is not None:
+                return chunk_summary
+            async with semaphore:
+                chunk_summary = await self._generate_async(self._chunk_summary_prompt(chunk, chunk_number, chunk_count, style))
+            await asyncio.to_thread(self._cache_put, cache_key, chunk_summary)
+            return chunk_summary
+
+        partial_text = text
+        for _ in range(SUMMARY_MAX_MAP_ROUNDS):
+            input_tokens = estimate_tokens(partial_text)
+            chunks = split_into_content_defined_chunks(partial_text, chunk_tokens, overlap_tokens)
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(summarize_chunk(chunk, chunk_number, len(chunks)))
+                         for chunk_number, chunk in enumerate(chunks, start=1)]
+            partial_text = "\n\n".join(task.result() for task in tasks)
+            # Reduce once the partial summaries fit in a single prompt, or as soon as a
+            # round fails to shrink the text (another round would only cost more calls)
+            if len(chunks) == 1 or estimate_tokens(partial_text) <= chunk_tokens \
+                    or estimate_tokens(partial_text) >= input_tokens:
+                break
+        return await self._generate_async(self._reduce_summary_prompt(partial_text, style))
+
+    async def generate_quiz_async(self, pdf_text, parallel=None):
+        """Async version of `generate_quiz`; in parallel mode the sections run as concurrent tasks."""
+        parallel = self.parallel_quiz if parallel is None else parallel
+        cache_key = self._cache_key(QUIZ_PROMPT_VERSION, "sections" if parallel else "default", pdf_text)
+        cached_quiz = await asyncio.to_thread(self._cache_get, cache_key)
+        if cached_quiz is not None:
+            return json.loads(cached_quiz)
+
+        if parallel:
+            section_results = await asyncio.gather(
+                *(self._generate_quiz_section_async(pdf_text, section) for section in QUIZ_SECTIONS),
+                return_exceptions=True)
+            for section, result in zip(QUIZ_SECTIONS, section_results):
+                if isinstance(result, BaseException):
+                    print(f"Error generating {section[0]} quiz questions: {result}")
+            section_results = [None if isinstance(result, BaseException) else result for result in section_results]
+            quiz_data = self._merge_quiz_sections(section_results)
+            # Only complete quizzes are cached; a partial one is retried next time
+            if quiz_data and all(section_results):
+                await asyncio.to_thread(self._cache_put, cache_key, json.dumps(quiz_data))
+            return quiz_data
+
+        response_text = None
+        try:
+            response_text = await self._generate_async(self._quiz_prompt(pdf_text), self._quiz_response_schema())
+            quiz_data, complete = self._parse_quiz(response_text)
+            # Only complete quizzes are cached; a salvaged one is retried next time
+            if complete:
+                await asyncio.to_thread(self._cache_put, cache_key, json.dumps(quiz_data))
             return quiz_data
 
         except json.JSONDecodeError as e:
             print(f"Error decoding quiz JSON from Gemini response: {e}")
-            print(f"Raw response text: {response.text}")
+            print(f"Raw response text: {response_text}")
             return None
         except Exception as e:
             print(f"Error generating quiz: {e}")
             return None
 
+    async def _generate_quiz_section_async(self, pdf_text, section):
+        response_text = await self._generate_async(self._quiz_section_prompt(pdf_text, section),
+                                                   section[3] if self.structured_quiz else None)
+        return self._section_questions(response_text, section)
+
+    async def summarize_and_quiz_async(self, text, style="academic"):
+        """
+        Generates the summary and the quiz for the same text concurrently and returns
+        (summary, quiz_data); either is None if its generation failed. Total time is
+        that of the slower call. Cancelling this coroutine cancels both calls.
+        """
+        async with asyncio.TaskGroup() as group:
+            summary_task = group.create_task(self.summarize_text_async(text, style))
+            quiz_task = group.create_task(self.generate_quiz_async(text))
+        return summary_task.result(), quiz_task.result()
+
 if __name__ == '__main__':
     # Example usage for testing agent functions
     agent = StudyAgent()
@@ -0,0 +1,115 @@
+"""
+SQLite connection profile benchmark.
+
+Compares the connection profiles in database.CONNECTION_PROFILES on a scratch
+database seeded with documents and summaries:
+- write throughput: quiz attempts inserted one committed transaction at a time;
+- read throughput: latest-summary lookups;
+- mixed load: one writer and several reader threads, each with its own
+  connection, running concurrently (as with several Streamlit sessions).
+
+Run with: python bench_sqlite.py [seconds per mixed run]
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+from database import CONNECTION_PROFILES, connect_db, create_tables, insert_pdf_data, insert_summary, \
+                     insert_quiz, get_summary, insert_quiz_attempt
+
+SEED_DOCUMENTS = 200
+WRITES = 500
+READS = 20000
+MIXED_READERS = 4
+
+def seed(database):
+    """Creates the schema and a quiz to attach attempts to; returns the quiz ID."""
+    conn = connect_db(database, "default")
+    create_tables(conn)
+    for i in range(SEED_DOCUMENTS):
+        pdf_id = insert_pdf_data(conn, f"doc{i}.pdf", "Lecture text. " * 500, f"sha{i}")
+        insert_summary(conn, pdf_id, "Summary text. " * 100)
+    quiz_id = insert_quiz(conn, 1, {"mcqs": [], "mixed_questions": []})
+    conn.close()
+    return quiz_id
+
+def bench_writes(database, profile, quiz_id):
+    """Returns committed single-row writes per second."""
+    conn = connect_db(database, profile)
+    start = time.perf_counter()
+    for i in range(WRITES):
+        insert_quiz_attempt(conn, quiz_id, {"mcq_0": "A"}, i % 20)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return WRITES / elapsed
+
+def bench_reads(database, profile):
+    """Returns latest-summary lookups per second."""
+    conn = connect_db(database, profile)
+    start = time.perf_counter()
+    for i in range(READS):
+        get_summary(conn, i % SEED_DOCUMENTS + 1)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return READS / elapsed
+
+def bench_mixed(database, profile, quiz_id, seconds):
+    """Returns (reads/s, writes/s, lock errors) with one writer and MIXED_READERS readers running at once."""
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    counts_lock = threading.Lock()
+
+    def count(key):
+        with counts_lock:
+            counts[key] += 1
+
+    def reader(worker):
+        conn = connect_db(database, profile)
+        i = worker
+        while not stop.is_set():
+            try:
+                get_summary(conn, i % SEED_DOCUMENTS + 1)
+                count("reads")
+            except sqlite3.OperationalError:
+                count("errors")
+            i += MIXED_READERS
+        conn.close()
+
+    def writer():
+        conn = connect_db(database, profile)
+        while not stop.is_set():
+            try:
+                insert_quiz_attempt(conn, quiz_id, {"mcq_0": "B"}, 1)
+                count("writes")
+            except sqlite3.OperationalError:
+                conn.rollback()
+                count("errors")
+        conn.close()
+
+    threads = [threading.Thread(target=reader, args=(worker,)) for worker in range(MIXED_READERS)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts["reads"] / seconds, counts["writes"] / seconds, counts["errors"]
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    print(f"{'profile':<10} {'writes/s':>10} {'reads/s':>10} {'mixed reads/s':>14} {'mixed writes/s':>15} {'lock errors':>12}")
+    for profile in CONNECTION_PROFILES:
+        work_dir = tempfile.mkdtemp()
+        try:
+            database = os.path.join(work_dir, "bench.db")
+            quiz_id = seed(database)
+            writes = bench_writes(database, profile, quiz_id)
+            reads = bench_reads(database, profile)
+            mixed_reads, mixed_writes, errors = bench_mixed(database, profile, quiz_id, seconds)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        print(f"{profile:<10} {writes:>10.0f} {reads:>10.0f} {mixed_reads:>14.0f} {mixed_writes:>15.0f} {errors:>12}")
@@ -0,0 +1,76 @@
+"""
+Startup benchmark for the Streamlit app.
+
+Measures:
+- the time to `import agent` in a fresh interpreter, next to the heavy SDKs it
+  used to import eagerly (google.generativeai, pypdf, dotenv);
+- the latency of the first render of main.py and of a rerun, using Streamlit's
+  AppTest harness with the offline fake backend (no API key or network needed).
+
+Run with: python bench_startup.py [repeats]
+"""
+import os
+import sys
+import shutil
+import tempfile
+import importlib.util
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def time_import(module, repeats):
+    """Returns the median time in seconds to import `module` in a fresh interpreter."""
+    code = ("import sys, time; sys.path.insert(0, %r); start = time.perf_counter(); "
+            "import %s; print(time.perf_counter() - start)" % (PROJECT_DIR, module))
+    timings = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                env={**os.environ, "STUDY_AGENT_BACKEND": "fake"})
+        if result.returncode != 0:
+            return None
+        timings.append(float(result.stdout.strip()))
+    return statistics.median(timings)
+
+def time_first_render(repeats):
+    """Returns the median (first render, rerun) latency in seconds of main.py, or None without Streamlit."""
+    if importlib.util.find_spec("streamlit") is None:
+        return None
+    # Each repeat runs in a fresh interpreter from an empty scratch directory, so
+    # st.cache_resource, the imported modules and the database all start cold
+    code = ("import time; from streamlit.testing.v1 import AppTest; "
+            "app = AppTest.from_file(%r, default_timeout=60); "
+            "start = time.perf_counter(); app.run(); first_render = time.perf_counter() - start; "
+            "start = time.perf_counter(); app.run(); rerun = time.perf_counter() - start; "
+            "print(first_render, rerun)" % os.path.join(PROJECT_DIR, "main.py"))
+    first_renders, reruns = [], []
+    for _ in range(repeats):
+        work_dir = tempfile.mkdtemp()
+        try:
+            result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=work_dir,
+                                    env={**os.environ, "STUDY_AGENT_BACKEND": "fake"})
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Rendering main.py failed:\n{result.stderr}")
+        first_render, rerun = map(float, result.stdout.split()[-2:])
+        first_renders.append(first_render)
+        reruns.append(rerun)
+    return statistics.median(first_renders), statistics.median(reruns)
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print("--- Import time (median of fresh interpreters) ---")
+    for module in ("agent", "google.generativeai", "pypdf", "dotenv"):
+        timing = time_import(module, repeats)
+        print(f"{module:<22} {'not installed' if timing is None else f'{timing * 1000:8.1f} ms'}")
+
+    print("\n--- main.py render latency (fake backend) ---")
+    render_timings = time_first_render(repeats)
+    if render_timings is None:
+        print("streamlit is not installed; skipping render benchmark.")
+    else:
+        first_render, rerun = render_timings
+        print(f"first render           {first_render * 1000:8.1f} ms")
+        print(f"rerun                  {rerun * 1000:8.1f} ms")
@@ -1,32 +1,349 @@
 import sqlite3
 import json
 import os
+import time
+import queue
+import codecs
+import atexit
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
 
 DATABASE_NAME = 'study_agent.db'
 
-def connect_db():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_NAME)
+# LLM response cache limits: least recently used entries are evicted once the
+# cached responses exceed CACHE_MAX_BYTES, and entries expire after CACHE_TTL_SECONDS.
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Connection profiles: PRAGMA settings applied to every new connection.
+# - "default": SQLite's defaults (rollback journal, a full fsync on every commit).
+# - "tuned": write-ahead logging so readers are not blocked by a writer, fsync only
+#   at checkpoints (synchronous=NORMAL, still safe against application crashes),
+#   memory-mapped reads, a 64 MB page cache, in-memory temp tables, and waiting up
+#   to 5 seconds for a lock instead of failing with "database is locked".
+CONNECTION_PROFILES = {
+    "default": {},
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # Negative values are KiB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # Milliseconds
+    },
+}
+DEFAULT_PROFILE = os.getenv("STUDY_AGENT_DB_PROFILE", "tuned")
+
+def _column_names(conn, table):
+    return [column[1] for column in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+def _rebuild_pdf_files_without_unique_filename(conn):
+    """
+    pdf_files tables created before content hashing made filename the unique key;
+    rebuild them without that constraint (SQLite cannot drop it in place).
+    """
+    if 'content_sha256' in _column_names(conn, 'pdf_files'):
+        return
+    conn.execute("DROP TABLE IF EXISTS pdf_files_new")  # Left behind by an interrupted rebuild
+    conn.execute('''
+        CREATE TABLE pdf_files_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            text_content TEXT NOT NULL,
+            uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            content_sha256 TEXT UNIQUE
+        )
+    ''')
+    conn.execute('''INSERT INTO pdf_files_new (id, filename, text_content, uploaded_at)
+                    SELECT id, filename, text_content, uploaded_at FROM pdf_files''')
+    conn.execute("DROP TABLE pdf_files")
+    conn.execute("ALTER TABLE pdf_files_new RENAME TO pdf_files")
+
+def _add_quiz_source_column(conn):
+    """Quizzes tables created before quiz sources were recorded lack the column."""
+    if 'source' not in _column_names(conn, 'quizzes'):
+        conn.execute("ALTER TABLE quizzes ADD COLUMN source TEXT NOT NULL DEFAULT 'full'")
+
+def _add_page_fingerprint_column(conn):
+    """Pages stored before page fingerprinting lack the column."""
+    if 'fingerprint' not in _column_names(conn, 'pdf_pages'):
+        conn.execute("ALTER TABLE pdf_pages ADD COLUMN fingerprint TEXT")
+
+# Schema migrations, applied in order by `migrate`. Migration N (1-based) brings the
+# database to `PRAGMA user_version` N; append new migrations, never edit applied ones.
+# A migration is a list of SQL statements or a function taking the connection.
+# Tables are created by `create_tables` in their current shape before migrating,
+# so migrations that change a table's columns first check whether it is needed.
+MIGRATIONS = [
+    # 1: latest summary of a PDF (get_summary) without scanning summaries
+    ["CREATE INDEX IF NOT EXISTS idx_summaries_pdf_generated ON summaries (pdf_id, generated_at DESC)"],
+    # 2: latest quiz of a PDF (get_quiz) without scanning quizzes
+    ["CREATE INDEX IF NOT EXISTS idx_quizzes_pdf_generated ON quizzes (pdf_id, generated_at DESC)"],
+    # 3: attempts of a quiz, in order
+    ["CREATE INDEX IF NOT EXISTS idx_quiz_attempts_quiz_attempted ON quiz_attempts (quiz_id, attempted_at)"],
+    # 4: latest summary/quiz lookups also order by id to break timestamp ties;
+    # include it in the indexes so the ORDER BY needs no temporary sort
+    ["DROP INDEX IF EXISTS idx_summaries_pdf_generated",
+     "CREATE INDEX IF NOT EXISTS idx_summaries_pdf_generated_id ON summaries (pdf_id, generated_at DESC, id DESC)",
+     "DROP INDEX IF EXISTS idx_quizzes_pdf_generated",
+     "CREATE INDEX IF NOT EXISTS idx_quizzes_pdf_generated_id ON quizzes (pdf_id, generated_at DESC, id DESC)"],
+    # 5-7: upgrades from before schema versioning, formerly applied by create_tables
+    _rebuild_pdf_files_without_unique_filename,
+    _add_quiz_source_column,
+    _add_page_fingerprint_column,
+]
+
+def connect_db(database=DATABASE_NAME, profile=None, check_same_thread=True):
+    """
+    Establishes a connection to the SQLite database, configured by a connection
+    profile (defaults to STUDY_AGENT_DB_PROFILE, then "tuned").
+    """
+    profile = profile or DEFAULT_PROFILE
+    if profile not in CONNECTION_PROFILES:
+        raise ValueError(f"Unknown database profile '{profile}'. Expected one of {list(CONNECTION_PROFILES)}.")
+    conn = sqlite3.connect(database, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row  # Access columns by name
+    for pragma, value in CONNECTION_PROFILES[profile].items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
     return conn
 
+# Idle reader connections kept open by a ConnectionPool; extra ones are closed on return
+POOL_MAX_IDLE_READERS = 8
+
+class ConnectionPool:
+    """
+    Thread-safe pool of connections to a database file, shared by every thread of
+    the process (Streamlit reruns, sessions and the agent's worker threads).
+    - `reader()` checks out a read-only connection for the calling thread. Readers
+      are reused across checkouts, so connection setup and schema parsing are paid
+      once per connection rather than per call, and concurrent readers do not wait
+      for each other.
+    - `writer()` checks out the single write connection; a lock serializes writers
+      and uncommitted changes are rolled back on error.
+    """
+    def __init__(self, database=DATABASE_NAME, profile=None, max_idle_readers=POOL_MAX_IDLE_READERS):
+        self.database = database
+        self.profile = profile
+        self.max_idle_readers = max_idle_readers
+        self._writer = connect_db(database, profile, check_same_thread=False)
+        self._write_lock = threading.RLock()
+        self._idle_readers = []
+        self._readers_lock = threading.Lock()
+        self._closed = False
+
+    def _connect_reader(self):
+        conn = connect_db(self.database, self.profile, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Yields a read-only connection owned by the calling thread until the block ends."""
+        with self._readers_lock:
+            conn = self._idle_readers.pop() if self._idle_readers else None
+        if conn is None:
+            conn = self._connect_reader()
+        try:
+            yield conn
+        finally:
+            # End any open read transaction so the connection sees later writes
+            conn.rollback()
+            with self._readers_lock:
+                if not self._closed and len(self._idle_readers) < self.max_idle_readers:
+                    self._idle_readers.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    @contextmanager
+    def writer(self):
+        """Yields the write connection, held exclusively by the calling thread until the block ends."""
+        with self._write_lock:
+            try:
+                yield self._writer
+            except Exception:
+                self._writer.rollback()
+                raise
+
+    def close(self):
+        """Closes the writer and the idle readers; readers checked out are closed on return."""
+        with self._readers_lock:
+            self._closed = True
+            idle_readers, self._idle_readers = self._idle_readers, []
+        for conn in idle_readers:
+            conn.close()
+        with self._write_lock:
+            self._writer.close()
+
+# Write-behind queue: pending writes are committed together at most every
+# WRITE_BEHIND_FLUSH_INTERVAL seconds (or once WRITE_BEHIND_MAX_BATCH are waiting),
+# and submitting blocks while WRITE_BEHIND_MAX_PENDING writes are queued.
+WRITE_BEHIND_FLUSH_INTERVAL = 0.5
+WRITE_BEHIND_MAX_BATCH = 500
+WRITE_BEHIND_MAX_PENDING = 2000
+
+# Queue markers for the writer thread
+_FLUSH = object()
+_STOP = object()
+
+class WriteBehindQueue:
+    """
+    Moves database writes off the request path. `submit` queues a write and
+    returns at once; a background thread runs queued writes on the pool's writer
+    connection and commits each batch in a single transaction. A bounded queue
+    applies backpressure: when it is full, `submit` waits for the writer to catch up.
+    Queued writes are flushed when the process exits.
+    """
+    def __init__(self, pool, flush_interval=WRITE_BEHIND_FLUSH_INTERVAL, max_batch=WRITE_BEHIND_MAX_BATCH,
+                 max_pending=WRITE_BEHIND_MAX_PENDING):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="database-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, write, *args, timeout=None, **kwargs):
+        """
+        Queues `write(conn, *args, commit=False, **kwargs)`, e.g. `insert_quiz_attempt`,
+        and returns a Future for its result. Waits up to `timeout` seconds (forever
+        by default) while the queue is full, then raises queue.Full.
+        """
+        if self._closed:
+            raise RuntimeError("Write-behind queue is closed.")
+        future = Future()
+        self._queue.put((write, args, kwargs, future), timeout=timeout)
+        return future
+
+    def flush(self, timeout=None):
+        """Blocks until every write queued before the call is committed."""
+        if self._closed:
+            raise RuntimeError("Write-behind queue is closed.")
+        done = Future()
+        self._queue.put((_FLUSH, done), timeout=timeout)
+        done.result(timeout)
+
+    def close(self, timeout=None):
+        """Flushes the queued writes and stops the writer thread."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put((_STOP, None))
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch, marker = self._next_batch()
+            if batch:
+                self._write_batch(batch)
+            if marker is not None:
+                kind, done = marker
+                if kind is _STOP:
+                    return
+                done.set_result(None)
+
+    def _next_batch(self):
+        """Waits for writes, then collects more for up to one flush interval; returns (batch, marker or None)."""
+        batch = []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if item[0] is _FLUSH or item[0] is _STOP:
+                return batch, item
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                return batch, None
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, None
+
+    def _write_batch(self, batch):
+        """Commits a batch in one transaction; if that fails, retries its writes one by one."""
+        with self.pool.writer() as conn:
+            try:
+                results = [write(conn, *args, commit=False, **kwargs) for write, args, kwargs, _ in batch]
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"Error writing batch to database, retrying writes individually: {e}")
+                for write, args, kwargs, future in batch:
+                    try:
+                        result = write(conn, *args, commit=False, **kwargs)
+                        conn.commit()
+                    except Exception as e:
+                        conn.rollback()
+                        print(f"Error writing to database: {e}")
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+                return
+        for (_, _, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+def open_connection_pool(database=DATABASE_NAME, profile=None):
+    """Opens the process-wide connection pool and ensures the schema exists (once, at startup)."""
+    pool = ConnectionPool(database, profile)
+    with pool.writer() as conn:
+        create_tables(conn)
+    return pool
+
 def create_tables(conn):
     """
     Creates necessary tables in the database if they do not already exist:
-    - pdf_files: Stores metadata and extracted text of uploaded PDFs.
+    - pdf_files: Stores metadata and extracted text of uploaded PDFs, one row per distinct document.
+    - pdf_aliases: Maps the filenames a document was uploaded under to its pdf_files row.
+    - pdf_pages: Stores the extracted text of each PDF page.
     - summaries: Stores generated summaries for PDFs.
     - quizzes: Stores generated quizzes for PDFs.
     - quiz_attempts: Stores user's quiz attempts and scores.
+    - llm_cache: Caches model responses for previously processed inputs.
     """
     cursor = conn.cursor()
 
-    # Table for PDF files
+    # Table for PDF files. Documents are identified by the SHA-256 of their bytes;
+    # `filename` is the name of the first upload, other names live in pdf_aliases.
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS pdf_files (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT UNIQUE NOT NULL,
+            filename TEXT NOT NULL,
             text_content TEXT NOT NULL,
-            uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            content_sha256 TEXT UNIQUE
+        )
+    ''')
+
+    # Table for the filenames each document was uploaded under. Different documents
+    # may share a filename; the most recently seen one is current for that name.
+    # last_seen_at is in Unix seconds.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_aliases (
+            filename TEXT NOT NULL,
+            pdf_id INTEGER NOT NULL,
+            last_seen_at REAL NOT NULL,
+            PRIMARY KEY (filename, pdf_id),
+            FOREIGN KEY (pdf_id) REFERENCES pdf_files (id)
+        )
+    ''')
+    # Every document is reachable under the name it was first uploaded as
+    cursor.execute('''INSERT OR IGNORE INTO pdf_aliases (filename, pdf_id, last_seen_at)
+                      SELECT filename, id, CAST(strftime('%s', uploaded_at) AS REAL) FROM pdf_files''')
+
+    # Table for per-page text, so page ranges can be read without loading the whole document
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_pages (
+            pdf_id INTEGER NOT NULL,
+            page_no INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            fingerprint TEXT, -- SHA-256 of the page's content stream and resources
+            PRIMARY KEY (pdf_id, page_no),
+            FOREIGN KEY (pdf_id) REFERENCES pdf_files (id)
         )
     ''')
 
@@ -49,6 +366,7 @@ def create_tables(conn):
             pdf_id INTEGER NOT NULL,
             quiz_data TEXT NOT NULL, -- Stored as JSON
             generated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            source TEXT NOT NULL DEFAULT 'full', -- Material the quiz was generated from
             FOREIGN KEY (pdf_id) REFERENCES pdf_files (id)
         )
     ''')
@@ -65,28 +383,96 @@ def create_tables(conn):
         )
     ''')
 
+    # Table for cached model responses, keyed by model, prompt template version,
+    # style and SHA-256 of the input text. Timestamps are Unix seconds.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            model_name TEXT NOT NULL,
+            prompt_version INTEGER NOT NULL,
+            style TEXT NOT NULL,
+            input_sha256 TEXT NOT NULL,
+            response_text TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_accessed_at REAL NOT NULL,
+            PRIMARY KEY (model_name, prompt_version, style, input_sha256)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed ON llm_cache (last_accessed_at)")
+
     conn.commit()
+    migrate(conn)
 
-def insert_pdf_data(conn, filename, text_content):
-    """Inserts or updates PDF file data into the database."""
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO pdf_files (filename, text_content) VALUES (?, ?)",
-                       (filename, text_content))
-        conn.commit()
-        return cursor.lastrowid
-    except sqlite3.IntegrityError:
-        # If file already exists, update its content and return existing ID
-        cursor.execute("UPDATE pdf_files SET text_content = ? WHERE filename = ?",
-                       (text_content, filename))
+def get_schema_version(conn):
+    """Returns the schema version recorded in the database (0 before any migration)."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, migrations=MIGRATIONS):
+    """
+    Upgrades the database in place by applying the migrations newer than its
+    schema version, each in its own transaction together with the version bump,
+    so an interrupted upgrade resumes at the failed migration.
+    Returns the number of migrations applied.
+    """
+    current_version = get_schema_version(conn)
+    if current_version > len(migrations):
+        raise RuntimeError(f"Database schema version {current_version} is newer than this code supports ({len(migrations)}).")
+    for version, statements in enumerate(migrations[current_version:], start=current_version + 1):
         conn.commit()
-        cursor.execute("SELECT id FROM pdf_files WHERE filename = ?", (filename,))
-        return cursor.fetchone()['id']
+        try:
+            conn.execute("BEGIN")
+            if callable(statements):
+                statements(conn)
+            else:
+                for statement in statements:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return len(migrations) - current_version
+
+def insert_pdf_data(conn, filename, text_content, content_sha256=None):
+    """
+    Inserts PDF file data into the database and records `filename` as an alias.
+    With `content_sha256` (SHA-256 hex digest of the PDF bytes), a document that is
+    already stored is not inserted again; the existing ID is returned instead.
+    Rows stored before content hashing have no hash; one with the same filename
+    and text is taken to be this document and gets `content_sha256` assigned.
+    """
+    cursor = conn.cursor()
+    existing = get_pdf_metadata_by_hash(conn, content_sha256) if content_sha256 else None
+    if existing is None and content_sha256:
+        cursor.execute("""SELECT id FROM pdf_files
+                          WHERE content_sha256 IS NULL AND filename = ? AND text_content = ?
+                          ORDER BY id DESC LIMIT 1""", (filename, text_content))
+        existing = cursor.fetchone()
+        if existing:
+            cursor.execute("UPDATE pdf_files SET content_sha256 = ? WHERE id = ?", (content_sha256, existing['id']))
+    if existing:
+        pdf_id = existing['id']
+    else:
+        cursor.execute("INSERT INTO pdf_files (filename, text_content, content_sha256) VALUES (?, ?, ?)",
+                       (filename, text_content, content_sha256))
+        pdf_id = cursor.lastrowid
+    add_pdf_alias(conn, filename, pdf_id)
+    return pdf_id
+
+def add_pdf_alias(conn, filename, pdf_id):
+    """Records that a document was uploaded under `filename`, making it the current document for that name."""
+    cursor = conn.cursor()
+    cursor.execute("""INSERT INTO pdf_aliases (filename, pdf_id, last_seen_at) VALUES (?, ?, ?)
+                      ON CONFLICT (filename, pdf_id) DO UPDATE SET last_seen_at = excluded.last_seen_at""",
+                   (filename, pdf_id, time.time()))
+    conn.commit()
 
 def get_pdf_data(conn, filename):
-    """Retrieves PDF data by filename."""
+    """Retrieves the PDF data most recently uploaded under a filename."""
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM pdf_files WHERE filename = ?", (filename,))
+    cursor.execute("""SELECT pdf_files.* FROM pdf_aliases JOIN pdf_files ON pdf_files.id = pdf_aliases.pdf_id
+                      WHERE pdf_aliases.filename = ?
+                      ORDER BY pdf_aliases.last_seen_at DESC LIMIT 1""", (filename,))
     return cursor.fetchone()
 
 def get_pdf_data_by_id(conn, pdf_id):
@@ -95,34 +481,186 @@ def get_pdf_data_by_id(conn, pdf_id):
     cursor.execute("SELECT * FROM pdf_files WHERE id = ?", (pdf_id,))
     return cursor.fetchone()
 
-def insert_summary(conn, pdf_id, summary_text, summary_style="default"):
+# Columns of pdf_files without the extracted text, for lookups that only need metadata
+PDF_METADATA_COLUMNS = "pdf_files.id, pdf_files.filename, pdf_files.uploaded_at, pdf_files.content_sha256"
+
+# Bytes read per call when streaming a document's text with incremental blob I/O
+TEXT_READ_CHUNK_BYTES = 1024 * 1024
+
+def get_pdf_metadata(conn, pdf_id):
+    """Retrieves the metadata of a PDF (id, filename, uploaded_at, content_sha256) by ID, without its text."""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {PDF_METADATA_COLUMNS} FROM pdf_files WHERE id = ?", (pdf_id,))
+    return cursor.fetchone()
+
+def get_pdf_metadata_by_hash(conn, content_sha256):
+    """Retrieves the metadata of a PDF by the SHA-256 hex digest of its bytes; doubles as an existence check."""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {PDF_METADATA_COLUMNS} FROM pdf_files WHERE content_sha256 = ?", (content_sha256,))
+    return cursor.fetchone()
+
+def get_pdf_metadata_by_filename(conn, filename):
+    """Retrieves the metadata of the PDF most recently uploaded under a filename."""
+    cursor = conn.cursor()
+    cursor.execute(f"""SELECT {PDF_METADATA_COLUMNS} FROM pdf_aliases JOIN pdf_files ON pdf_files.id = pdf_aliases.pdf_id
+                       WHERE pdf_aliases.filename = ?
+                       ORDER BY pdf_aliases.last_seen_at DESC LIMIT 1""", (filename,))
+    return cursor.fetchone()
+
+def list_pdf_metadata(conn):
+    """Retrieves the metadata of all stored PDFs, most recently uploaded first."""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {PDF_METADATA_COLUMNS} FROM pdf_files ORDER BY uploaded_at DESC, id DESC")
+    return cursor.fetchall()
+
+def iter_pdf_text(conn, pdf_id, chunk_bytes=TEXT_READ_CHUNK_BYTES):
+    """
+    Yields the extracted text of a PDF in pieces, read `chunk_bytes` at a time with
+    SQLite incremental blob I/O so the whole text is never held in memory at once.
+    Falls back to a single SELECT where blob I/O is unavailable.
+    """
+    try:
+        blob = conn.blobopen("pdf_files", "text_content", pdf_id, readonly=True)
+    except (AttributeError, sqlite3.Error):
+        cursor = conn.cursor()
+        cursor.execute("SELECT text_content FROM pdf_files WHERE id = ?", (pdf_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(f"No PDF with id {pdf_id}.")
+        yield row['text_content']
+        return
+    # Pieces may end mid-character; the incremental decoder carries the rest over
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with blob:
+        while True:
+            data = blob.read(chunk_bytes)
+            if not data:
+                break
+            yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
+def read_pdf_text(conn, pdf_id):
+    """Retrieves the extracted text of a PDF through incremental blob I/O (see iter_pdf_text)."""
+    return "".join(iter_pdf_text(conn, pdf_id))
+
+class PdfDocument:
+    """
+    Lazy handle on a stored PDF: metadata is loaded up front, the extracted text
+    only when `text_content` is first accessed, through a reader connection of
+    `pool`. Listing or checking documents therefore costs the same whatever their size.
+    """
+    def __init__(self, pool, metadata):
+        self.pool = pool
+        self.id = metadata['id']
+        self.filename = metadata['filename']
+        self.uploaded_at = metadata['uploaded_at']
+        self.content_sha256 = metadata['content_sha256']
+        self._text_content = None
+
+    @property
+    def text_content(self):
+        if self._text_content is None:
+            with self.pool.reader() as conn:
+                self._text_content = read_pdf_text(conn, self.id)
+        return self._text_content
+
+    def iter_text(self, chunk_bytes=TEXT_READ_CHUNK_BYTES):
+        """Yields the extracted text in pieces without loading it whole (see iter_pdf_text)."""
+        with self.pool.reader() as conn:
+            yield from iter_pdf_text(conn, self.id, chunk_bytes)
+
+def get_pdf_document(pool, pdf_id):
+    """Returns a lazy PdfDocument for a PDF ID, or None if there is no such PDF."""
+    with pool.reader() as conn:
+        metadata = get_pdf_metadata(conn, pdf_id)
+    return PdfDocument(pool, metadata) if metadata else None
+
+def get_pdf_document_by_hash(pool, content_sha256):
+    """Returns a lazy PdfDocument for the SHA-256 hex digest of a PDF's bytes, or None if it is not stored."""
+    with pool.reader() as conn:
+        metadata = get_pdf_metadata_by_hash(conn, content_sha256)
+    return PdfDocument(pool, metadata) if metadata else None
+
+def insert_pdf_pages(conn, pdf_id, pages):
+    """
+    Stores the per-page text of a PDF, replacing any previously stored pages.
+    `pages` is an iterable of (page_no, text) or (page_no, text, fingerprint)
+    tuples, such as the output of StudyAgent.iter_pages or
+    StudyAgent.iter_pages_incremental, and is consumed incrementally.
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM pdf_pages WHERE pdf_id = ?", (pdf_id,))
+    cursor.executemany("INSERT INTO pdf_pages (pdf_id, page_no, text, fingerprint) VALUES (?, ?, ?, ?)",
+                       ((pdf_id, page[0], page[1], page[2] if len(page) > 2 else None) for page in pages))
+    conn.commit()
+    return cursor.rowcount
+
+def get_page_texts_by_fingerprint(conn, pdf_id):
+    """
+    Returns a {fingerprint: text} dict of the fingerprinted pages of a PDF, for
+    reusing their text when a revised version is extracted.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT fingerprint, text FROM pdf_pages WHERE pdf_id = ? AND fingerprint IS NOT NULL", (pdf_id,))
+    return {row['fingerprint']: row['text'] for row in cursor.fetchall()}
+
+def _query_pdf_pages(conn, pdf_id, start_page, end_page):
+    """Runs the page-range query for a PDF and returns the cursor positioned before the first page."""
+    cursor = conn.cursor()
+    if end_page is None:
+        cursor.execute("SELECT page_no, text FROM pdf_pages WHERE pdf_id = ? AND page_no >= ? ORDER BY page_no",
+                       (pdf_id, start_page))
+    else:
+        cursor.execute("SELECT page_no, text FROM pdf_pages WHERE pdf_id = ? AND page_no BETWEEN ? AND ? ORDER BY page_no",
+                       (pdf_id, start_page, end_page))
+    return cursor
+
+def get_pdf_pages(conn, pdf_id, start_page=1, end_page=None):
+    """Retrieves the pages start_page..end_page (inclusive, 1-based) of a PDF in order."""
+    return _query_pdf_pages(conn, pdf_id, start_page, end_page).fetchall()
+
+def iter_pdf_pages(conn, pdf_id, start_page=1, end_page=None, batch_size=50):
+    """
+    Yields (page_no, text) rows of a PDF in page order, fetching `batch_size`
+    pages at a time so only a small window of the document is held in memory.
+    """
+    cursor = _query_pdf_pages(conn, pdf_id, start_page, end_page)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+def insert_summary(conn, pdf_id, summary_text, summary_style="default", commit=True):
     """Inserts a generated summary for a PDF."""
     cursor = conn.cursor()
     cursor.execute("INSERT INTO summaries (pdf_id, summary_text, summary_style) VALUES (?, ?, ?)",
                    (pdf_id, summary_text, summary_style))
-    conn.commit()
+    if commit:
+        conn.commit()
     return cursor.lastrowid
 
 def get_summary(conn, pdf_id):
     """Retrieves the latest summary for a given PDF ID."""
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM summaries WHERE pdf_id = ? ORDER BY generated_at DESC LIMIT 1",
+    cursor.execute("SELECT * FROM summaries WHERE pdf_id = ? ORDER BY generated_at DESC, id DESC LIMIT 1",
                    (pdf_id,))
     return cursor.fetchone()
 
-def insert_quiz(conn, pdf_id, quiz_data):
-    """Inserts a generated quiz (as JSON) for a PDF."""
+def insert_quiz(conn, pdf_id, quiz_data, source="full", commit=True):
+    """Inserts a generated quiz (as JSON) for a PDF, recording the material it was generated from."""
     cursor = conn.cursor()
     quiz_json = json.dumps(quiz_data)
-    cursor.execute("INSERT INTO quizzes (pdf_id, quiz_data) VALUES (?, ?)",
-                   (pdf_id, quiz_json))
-    conn.commit()
+    cursor.execute("INSERT INTO quizzes (pdf_id, quiz_data, source) VALUES (?, ?, ?)",
+                   (pdf_id, quiz_json, source))
+    if commit:
+        conn.commit()
     return cursor.lastrowid
 
 def get_quiz(conn, pdf_id):
     """Retrieves the latest quiz for a given PDF ID."""
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM quizzes WHERE pdf_id = ? ORDER BY generated_at DESC LIMIT 1",
+    cursor.execute("SELECT * FROM quizzes WHERE pdf_id = ? ORDER BY generated_at DESC, id DESC LIMIT 1",
                    (pdf_id,))
     quiz_row = cursor.fetchone()
     if quiz_row:
@@ -130,15 +668,65 @@ def get_quiz(conn, pdf_id):
         return {**quiz_row, 'quiz_data': quiz_data}
     return None
 
-def insert_quiz_attempt(conn, quiz_id, user_answers, score):
+def insert_quiz_attempt(conn, quiz_id, user_answers, score, commit=True):
     """Inserts a user's quiz attempt and score."""
     cursor = conn.cursor()
     user_answers_json = json.dumps(user_answers)
     cursor.execute("INSERT INTO quiz_attempts (quiz_id, user_answers, score) VALUES (?, ?, ?)",
                    (quiz_id, user_answers_json, score))
-    conn.commit()
+    if commit:
+        conn.commit()
     return cursor.lastrowid
 
+def get_cached_response(conn, model_name, prompt_version, style, input_sha256, ttl_seconds=CACHE_TTL_SECONDS):
+    """
+    Retrieves a cached model response, or None if it is missing or expired.
+    A hit refreshes the entry's last access time for LRU eviction.
+    """
+    cursor = conn.cursor()
+    now = time.time()
+    cursor.execute("""SELECT rowid, response_text FROM llm_cache
+                      WHERE model_name = ? AND prompt_version = ? AND style = ? AND input_sha256 = ?
+                        AND created_at >= ?""",
+                   (model_name, prompt_version, style, input_sha256, now - ttl_seconds))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute("UPDATE llm_cache SET last_accessed_at = ? WHERE rowid = ?", (now, row['rowid']))
+    conn.commit()
+    return row['response_text']
+
+def put_cached_response(conn, model_name, prompt_version, style, input_sha256, response_text,
+                        max_bytes=CACHE_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+    """Stores a model response in the cache, then evicts expired and least recently used entries."""
+    cursor = conn.cursor()
+    now = time.time()
+    cursor.execute("""INSERT OR REPLACE INTO llm_cache
+                      (model_name, prompt_version, style, input_sha256, response_text, size_bytes, created_at, last_accessed_at)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                   (model_name, prompt_version, style, input_sha256, response_text,
+                    len(response_text.encode('utf-8')), now, now))
+    evict_cached_responses(conn, max_bytes, ttl_seconds)
+
+def evict_cached_responses(conn, max_bytes=CACHE_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+    """
+    Deletes expired cache entries, then the least recently used entries until the
+    total size of the cached responses is at most `max_bytes`.
+    Returns the number of entries deleted.
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - ttl_seconds,))
+    deleted = cursor.rowcount
+    cursor.execute("""DELETE FROM llm_cache WHERE rowid IN (
+                          SELECT rowid FROM (
+                              SELECT rowid, SUM(size_bytes) OVER (ORDER BY last_accessed_at DESC, rowid DESC) AS running_bytes
+                              FROM llm_cache
+                          ) WHERE running_bytes > ?
+                      )""", (max_bytes,))
+    deleted += cursor.rowcount
+    conn.commit()
+    return deleted
+
 if __name__ == '__main__':
     # Example usage (for testing database functions independently)
     conn = connect_db()
@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+
+# Rough characters-per-token ratio used to simulate output throughput
+CHARS_PER_TOKEN = 4
+
+# Backend selection for StudyAgent when none is passed explicitly:
+# "gemini" (default), "fake", "record" or "replay".
+BACKEND_ENV_VAR = "STUDY_AGENT_BACKEND"
+RECORDINGS_DIR_ENV_VAR = "STUDY_AGENT_RECORDINGS"
+DEFAULT_RECORDINGS_DIR = "llm_recordings"
+
+class LLMBackend:
+    """
+    Interface between StudyAgent and a text generation model.
+    Subclasses implement `generate` and `generate_stream`; the async variant
+    defaults to running `generate` in a worker thread.
+    """
+    model_name = None
+
+    def generate(self, prompt, response_schema=None):
+        """
+        Returns the response text for a prompt. With `response_schema`, the
+        response must be JSON matching the schema.
+        """
+        raise NotImplementedError
+
+    def generate_stream(self, prompt):
+        """Yields the response text for a prompt in pieces as it is produced."""
+        raise NotImplementedError
+
+    async def generate_async(self, prompt, response_schema=None):
+        """Async version of `generate`."""
+        return await asyncio.to_thread(self.generate, prompt, response_schema)
+
+class GeminiBackend(LLMBackend):
+    """
+    Generates text with a Gemini model through google.generativeai.
+    The SDK is imported and the client configured on the first call, so creating
+    the backend (and importing the agent) stays cheap.
+    """
+    def __init__(self, model_name='gemini-2.5-flash', api_key=None):
+        if api_key is None:
+            import dotenv
+            dotenv.load_dotenv()
+            api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in .env file. Please set it.")
+        self.model_name = model_name
+        self._api_key = api_key
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The google.generativeai model, created on first access."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self._api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def _generation_config(self, response_schema):
+        """Builds the generation config for a call; None keeps the model defaults."""
+        if response_schema is None:
+            return None
+        import google.generativeai as genai
+        return genai.GenerationConfig(response_mime_type="application/json", response_schema=response_schema)
+
+    def generate(self, prompt, response_schema=None):
+        response = self.model.generate_content(prompt, generation_config=self._generation_config(response_schema))
+        return response.text
+
+    def generate_stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True):
+            chunk_text = "".join(part.text for part in chunk.parts)
+            if chunk_text:
+                yield chunk_text
+
+    async def generate_async(self, prompt, response_schema=None):
+        response = await self.model.generate_content_async(prompt, generation_config=self._generation_config(response_schema))
+        return response.text
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic offline backend for benchmarks and load tests. Responses are
+    derived from the prompt (summaries from its sentences, quizzes as valid quiz
+    JSON), so the same prompt always gets the same response. Each call waits
+    `latency` seconds before the first output, then emits output at
+    `tokens_per_second` (None means instantly).
+    """
+    def __init__(self, model_name='gemini-2.5-flash', latency=0.0, tokens_per_second=None, seed=0):
+        self.model_name = f"fake-{model_name}"
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.seed = seed
+
+    def _rng(self, prompt):
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def _material(self, prompt):
+        """Returns the study material part of a prompt."""
+        for marker in ("Study Material:", "Part Summaries:", "PDF Text"):
+            if marker in prompt:
+                return prompt.rsplit(marker, 1)[1]
+        return prompt
+
+    def _sentences(self, prompt):
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", self._material(prompt)) if len(s.split()) >= 4]
+        return sentences or ["The material introduces its key concepts and definitions."]
+
+    def _summary(self, prompt):
+        rng = self._rng(prompt)
+        sentences = self._sentences(prompt)
+        picked = sorted(rng.sample(range(len(sentences)), min(8, len(sentences))))
+        lines = ["## Summary", ""] + [f"- {sentences[i]}" for i in picked]
+        return "\n".join(lines) + "\n"
+
+    def _quiz(self, prompt, response_schema):
+        rng = self._rng(prompt)
+        sentences = self._sentences(prompt)
+        keys = list(response_schema["properties"]) if response_schema else \
+            [key for key in ("mcqs", "mixed_questions") if f'"{key}"' in prompt]
+        quiz = {}
+        if "mcqs" in keys:
+            quiz["mcqs"] = []
+            for i in range(10):
+                sentence = rng.choice(sentences)
+                quiz["mcqs"].append({
+                    "question": f"Question {i + 1}: Which statement matches the material? {sentence}",
+                    "options": [f"{letter}. Option {letter} for question {i + 1}" for letter in "ABCD"],
+                    "correct_answer": rng.choice("ABCD"),
+                })
+        if "mixed_questions" in keys:
+            quiz["mixed_questions"] = []
+            # Section prompts ask for a single question type, the full quiz prompt for both
+            question_types = [question_type for question_type in ("true_false", "fill_in_the_blank")
+                              if f'"{question_type}"' in prompt] or ["true_false", "fill_in_the_blank"]
+            for question_type in question_types:
+                for _ in range(5):
+                    words = rng.choice(sentences).split()
+                    if question_type == "true_false":
+                        quiz["mixed_questions"].append({"type": question_type, "question": " ".join(words),
+                                                        "correct_answer": rng.choice(["True", "False"])})
+                    else:
+                        blank = rng.randrange(len(words))
+                        answer = words[blank]
+                        words[blank] = "_______"
+                        quiz["mixed_questions"].append({"type": question_type, "question": " ".join(words),
+                                                        "correct_answer": answer})
+        return json.dumps(quiz)
+
+    def _respond(self, prompt, response_schema=None):
+        if response_schema is not None or "quiz generator" in prompt:
+            return self._quiz(prompt, response_schema)
+        return self._summary(prompt)
+
+    def _output_delay(self, text):
+        if not self.tokens_per_second:
+            return 0.0
+        return len(text) / CHARS_PER_TOKEN / self.tokens_per_second
+
+    def generate(self, prompt, response_schema=None):
+        response_text = self._respond(prompt, response_schema)
+        time.sleep(self.latency + self._output_delay(response_text))
+        return response_text
+
+    def generate_stream(self, prompt):
+        response_text = self._respond(prompt)
+        time.sleep(self.latency)
+        for line in response_text.splitlines(keepends=True):
+            time.sleep(self._output_delay(line))
+            yield line
+
+    async def generate_async(self, prompt, response_schema=None):
+        response_text = self._respond(prompt, response_schema)
+        await asyncio.sleep(self.latency + self._output_delay(response_text))
+        return response_text
+
+class RecordReplayBackend(LLMBackend):
+    """
+    Persists responses to disk as one JSON file per request, keyed by a SHA-256 of
+    the model, prompt and schema. Modes:
+    - "record": call the `inner` backend and save every response.
+    - "replay": serve saved responses only; a missing recording raises KeyError.
+    - "auto": replay when a recording exists, otherwise record.
+    """
+    def __init__(self, directory=DEFAULT_RECORDINGS_DIR, inner=None, mode="replay", model_name='gemini-2.5-flash'):
+        if mode not in ("record", "replay", "auto"):
+            raise ValueError(f"Unknown record/replay mode '{mode}'.")
+        if mode != "replay" and inner is None:
+            raise ValueError("Recording requires an inner backend.")
+        self.directory = directory
+        self.inner = inner
+        self.mode = mode
+        self.model_name = inner.model_name if inner is not None else model_name
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, prompt, response_schema):
+        key = json.dumps({"model_name": self.model_name, "prompt": prompt, "response_schema": response_schema},
+                         sort_keys=True)
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + ".json")
+
+    def _load(self, prompt, response_schema):
+        """Returns the recorded response, or None if recording is allowed and there is none."""
+        path = self._path(prompt, response_schema)
+        if self.mode != "record" and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)["response"]
+        if self.mode == "replay":
+            raise KeyError(f"No recorded response for prompt (expected {path}).")
+        return None
+
+    def _save(self, prompt, response_schema, response_text):
+        path = self._path(prompt, response_schema)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump({"model_name": self.model_name, "prompt": prompt, "response_schema": response_schema,
+                       "response": response_text}, f)
+        os.replace(tmp_path, path)
+
+    def generate(self, prompt, response_schema=None):
+        response_text = self._load(prompt, response_schema)
+        if response_text is None:
+            response_text = self.inner.generate(prompt, response_schema)
+            self._save(prompt, response_schema, response_text)
+        return response_text
+
+    def generate_stream(self, prompt):
+        response_text = self._load(prompt, None)
+        if response_text is not None:
+            yield response_text
+            return
+        pieces = []
+        for piece in self.inner.generate_stream(prompt):
+            pieces.append(piece)
+            yield piece
+        self._save(prompt, None, "".join(pieces))
+
+    async def generate_async(self, prompt, response_schema=None):
+        response_text = self._load(prompt, response_schema)
+        if response_text is None:
+            response_text = await self.inner.generate_async(prompt, response_schema)
+            self._save(prompt, response_schema, response_text)
+        return response_text
+
+def create_backend(model_name='gemini-2.5-flash', kind=None):
+    """
+    Creates the backend named by `kind` (defaults to the STUDY_AGENT_BACKEND
+    environment variable, then "gemini"). Recordings for "record" and "replay"
+    live in STUDY_AGENT_RECORDINGS (default: llm_recordings).
+    """
+    kind = kind or os.getenv(BACKEND_ENV_VAR, "gemini")
+    recordings_dir = os.getenv(RECORDINGS_DIR_ENV_VAR, DEFAULT_RECORDINGS_DIR)
+    if kind == "gemini":
+        return GeminiBackend(model_name)
+    if kind == "fake":
+        return FakeBackend(model_name)
+    if kind == "record":
+        return RecordReplayBackend(recordings_dir, GeminiBackend(model_name), mode="record")
+    if kind == "replay":
+        return RecordReplayBackend(recordings_dir, mode="replay", model_name=model_name)
+    raise ValueError(f"Unknown LLM backend '{kind}'. Expected gemini, fake, record or replay.")
@@ -1,20 +1,41 @@
 import streamlit as st
 import os
 import json
-import tempfile
+import hashlib
 from datetime import datetime
-from database import connect_db, create_tables, insert_pdf_data, get_pdf_data, \
-                     insert_summary, get_summary, insert_quiz, get_quiz, \
-                     insert_quiz_attempt, get_pdf_data_by_id
-from agent import StudyAgent 
+from dotenv import load_dotenv
+# Load .env before importing the project modules: they read their settings
+# (rate limits, database profile, backend) from the environment at import time
+load_dotenv()
+from database import open_connection_pool, WriteBehindQueue, insert_pdf_data, get_pdf_metadata_by_filename, \
+                     insert_pdf_pages, insert_summary, get_summary, insert_quiz, get_quiz, \
+                     insert_quiz_attempt, get_pdf_document_by_hash, add_pdf_alias, \
+                     get_page_texts_by_fingerprint
+from agent import AsyncStudyAgent
 
 # --- Configuration ---
-conn = connect_db()
-create_tables(conn)
-conn.close()
-
-# Initialize StudyAgent
-study_agent = StudyAgent(model_name='gemini-2.5-flash')  # Using gemini-pro
+# Streamlit re-executes this script on every interaction; cache_resource builds the
+# database handle and the agent once per process and hands the same instances to
+# every rerun and session.
+@st.cache_resource
+def get_db():
+    # Opens the connection pool and creates the tables once, at startup
+    return open_connection_pool()
+
+# Initialize StudyAgent (the async variant also provides all synchronous methods).
+@st.cache_resource
+def get_study_agent():
+    return AsyncStudyAgent(model_name='gemini-2.5-flash', parallel_quiz=True, db=get_db())  # Using gemini-pro
+
+# Summaries, quizzes and quiz attempts are written in the background, batched into
+# one transaction per flush interval, so the page renders without waiting on a commit
+@st.cache_resource
+def get_write_queue():
+    return WriteBehindQueue(get_db())
+
+db = get_db()
+write_queue = get_write_queue()
+study_agent = get_study_agent()
 
 # Streamlit page configuration
 st.set_page_config(
@@ -150,10 +171,58 @@ p, div, span, label {
 
 
 # --- Session State Initialization ---
-for key in ['pdf_file_name', 'pdf_text_content', 'pdf_db_id', 'summary_text', 
+for key in ['pdf_file_id', 'pdf_text_content', 'pdf_db_id', 'summary_text', 
             'quiz_data', 'user_answers', 'quiz_submitted']:
     if key not in st.session_state:
         st.session_state[key] = None if key not in ['user_answers', 'quiz_submitted'] else {} if key == 'user_answers' else False
+# Latest summary/quiz rows read from the database, keyed by (kind, pdf_id)
+if 'db_cache' not in st.session_state:
+    st.session_state.db_cache = {}
+
+# --- Database read-through cache ---
+# Every widget interaction reruns this script; the latest summary and quiz of a PDF are
+# read (and the quiz JSON parsed) once per session, then served from session state.
+# Saving a new summary or quiz queues the write and caches the new value directly,
+# so this session sees it before the background writer has committed it.
+def load_summary(pdf_id):
+    """Returns the latest summary row for a PDF, or None."""
+    key = ('summary', pdf_id)
+    if key not in st.session_state.db_cache:
+        with db.reader() as conn:
+            st.session_state.db_cache[key] = get_summary(conn, pdf_id)
+    return st.session_state.db_cache[key]
+
+def load_quiz(pdf_id):
+    """Returns the latest quiz of a PDF with its quiz data parsed, or None."""
+    key = ('quiz', pdf_id)
+    if key not in st.session_state.db_cache:
+        with db.reader() as conn:
+            st.session_state.db_cache[key] = get_quiz(conn, pdf_id)
+    return st.session_state.db_cache[key]
+
+def save_summary(pdf_id, summary_text):
+    """Queues a summary insert and caches the summary as the latest one."""
+    write_queue.submit(insert_summary, pdf_id, summary_text)
+    st.session_state.db_cache[('summary', pdf_id)] = {'pdf_id': pdf_id, 'summary_text': summary_text}
+
+def save_quiz(pdf_id, quiz_data, source="full"):
+    """
+    Queues a quiz insert and caches the quiz as the latest one. Its ID is only
+    known once written, so the cached row keeps the insert's future instead.
+    """
+    id_future = write_queue.submit(insert_quiz, pdf_id, quiz_data, source=source)
+    st.session_state.db_cache[('quiz', pdf_id)] = {'pdf_id': pdf_id, 'quiz_data': quiz_data, 'source': source,
+                                                   'id_future': id_future}
+
+def save_quiz_attempt(quiz_record, user_answers, score):
+    """
+    Queues an attempt on the quiz the user answered. For a quiz still being written,
+    waits (at most about one flush interval) for its ID; raises if the quiz insert failed.
+    """
+    quiz_id = quiz_record.get('id')
+    if quiz_id is None:
+        quiz_id = quiz_record['id_future'].result()
+    write_queue.submit(insert_quiz_attempt, quiz_id, user_answers, score)
 
 # --- Sidebar ---
 with st.sidebar:
@@ -165,7 +234,7 @@ with st.sidebar:
     st.markdown("""
     1. Upload a PDF file using the "Choose a PDF file" button above.
     2. Once the PDF is uploaded and text is extracted, navigate to the "PDF Summary" tab.
-    3. Click "Generate Summary" to get a summary of your PDF content.
+    3. Click "Generate Summary" to get a summary of your PDF content, or "Generate Summary & Quiz" to create both at once.
     4. After the summary is generated, go to the "Quiz Generator" tab.
     5. Click "Create Quiz" to generate interactive multiple-choice and mixed questions.
     6. Answer the quiz questions and click "Check Answers" to see your score and results.
@@ -173,8 +242,10 @@ with st.sidebar:
     """)
 
     if uploaded_file:
-        if st.session_state.pdf_file_name != uploaded_file.name:
-            st.session_state.pdf_file_name = uploaded_file.name
+        # Each upload gets its own file_id, so a different file uploaded under the
+        # same name (e.g. a revised deck) is processed again
+        if st.session_state.pdf_file_id != uploaded_file.file_id:
+            st.session_state.pdf_file_id = uploaded_file.file_id
             st.session_state.pdf_text_content = None
             st.session_state.pdf_db_id = None
             st.session_state.summary_text = None
@@ -184,21 +255,48 @@ with st.sidebar:
             st.success(f"Loaded: {uploaded_file.name}")
 
         if st.session_state.pdf_text_content is None:
-            with st.spinner("Extracting text from PDF..."):
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                    tmp_file.write(uploaded_file.getvalue())
-                    tmp_file_path = tmp_file.name
-                text = study_agent.extract_text_from_pdf(tmp_file_path)
-                os.unlink(tmp_file_path)
-                if text:
-                    st.session_state.pdf_text_content = text
-                    conn = connect_db()
-                    st.session_state.pdf_db_id = insert_pdf_data(conn, uploaded_file.name, text)
-                    conn.close()
-                    st.success("Text extracted and saved to database!")
-                else:
-                    st.error("Failed to extract text from PDF.")
-                    st.session_state.pdf_file_name = None
+            # Hand pypdf a view of the uploaded bytes directly, no temp file or copy
+            pdf_buffer = uploaded_file.getbuffer()
+            # Documents are identified by their bytes, so a PDF seen before (under any
+            # filename) reuses its stored text, summary and quiz without any extraction
+            content_sha256 = hashlib.sha256(pdf_buffer).hexdigest()
+            known_pdf = get_pdf_document_by_hash(db, content_sha256)
+            if known_pdf:
+                with db.writer() as conn:
+                    add_pdf_alias(conn, uploaded_file.name, known_pdf.id)
+                pdf_buffer.release()
+                st.session_state.pdf_text_content = known_pdf.text_content
+                st.session_state.pdf_db_id = known_pdf.id
+                st.success("This document was processed before; loaded it from the database.")
+            else:
+                with st.spinner("Extracting text from PDF..."):
+                    # A revised upload of a document seen under the same filename only
+                    # extracts the pages whose content changed; the rest reuse stored text
+                    with db.reader() as conn:
+                        previous_pdf = get_pdf_metadata_by_filename(conn, uploaded_file.name)
+                        known_pages = get_page_texts_by_fingerprint(conn, previous_pdf['id']) if previous_pdf else {}
+                    # Consume pages as they are extracted instead of waiting for the whole document
+                    pages = []
+                    progress_text = st.empty()
+                    try:
+                        for page_number, page_text, fingerprint in study_agent.iter_pages_incremental(pdf_buffer, known_pages):
+                            pages.append((page_number, page_text, fingerprint))
+                            progress_text.caption(f"Extracted page {page_number}...")
+                        text = "".join(page_text + "\n" for _, page_text, _ in pages)
+                    except Exception as e:
+                        print(f"Error extracting text from PDF: {e}")
+                        text = None
+                    progress_text.empty()
+                    pdf_buffer.release()
+                    if text:
+                        st.session_state.pdf_text_content = text
+                        with db.writer() as conn:
+                            st.session_state.pdf_db_id = insert_pdf_data(conn, uploaded_file.name, text, content_sha256)
+                            insert_pdf_pages(conn, st.session_state.pdf_db_id, pages)
+                        st.success("Text extracted and saved to database!")
+                    else:
+                        st.error("Failed to extract text from PDF.")
+                        st.session_state.pdf_file_id = None
 
 # --- Main Content ---
 st.title("📚 Study Notes Summarizer & Quiz Generator")
@@ -209,9 +307,7 @@ with tab_summary:
     st.header("PDF Summary")
     existing_summary = None
     if st.session_state.pdf_db_id:
-        conn = connect_db()
-        existing_summary = get_summary(conn, st.session_state.pdf_db_id)
-        conn.close()
+        existing_summary = load_summary(st.session_state.pdf_db_id)
 
     if existing_summary:
         st.session_state.summary_text = existing_summary['summary_text']
@@ -220,17 +316,48 @@ with tab_summary:
     if st.session_state.summary_text:
         st.markdown(f'<div class="stCard"><h3>Summary</h3><p>{st.session_state.summary_text}</p></div>', unsafe_allow_html=True)
     else:
-        if st.button("Generate Summary", disabled=not st.session_state.pdf_db_id):
+        col_summary, col_both = st.columns(2)
+        generate_summary = col_summary.button("Generate Summary", disabled=not st.session_state.pdf_db_id)
+        generate_both = col_both.button("Generate Summary & Quiz", disabled=not st.session_state.pdf_db_id)
+        if generate_summary:
             with st.spinner("Generating summary using Gemini..."):
-                summary = study_agent.summarize_text(st.session_state.pdf_text_content)
+                # Render the summary progressively as Gemini streams it
+                summary_placeholder = st.empty()
+                summary_pieces = []
+                try:
+                    for piece in study_agent.summarize_text_stream(st.session_state.pdf_text_content):
+                        summary_pieces.append(piece)
+                        summary_placeholder.markdown(f'<div class="stCard"><h3>Summary</h3><p>{"".join(summary_pieces)}</p></div>', unsafe_allow_html=True)
+                    summary = "".join(summary_pieces)
+                except Exception as e:
+                    print(f"Error generating summary: {e}")
+                    summary = None
                 if summary:
                     st.session_state.summary_text = summary
-                    conn = connect_db()
-                    insert_summary(conn, st.session_state.pdf_db_id, summary)
-                    conn.close()
-                    st.markdown(f'<div class="stCard"><h3>Summary</h3><p>{st.session_state.summary_text}</p></div>', unsafe_allow_html=True)
+                    save_summary(st.session_state.pdf_db_id, summary)
                 else:
+                    summary_placeholder.empty()
                     st.error("Failed to generate summary.")
+        elif generate_both:
+            with st.spinner("Generating summary and quiz using Gemini..."):
+                # Both calls run concurrently, so this takes as long as the slower one
+                summary, quiz = study_agent.run(study_agent.summarize_and_quiz_async(st.session_state.pdf_text_content))
+            if summary:
+                st.session_state.summary_text = summary
+                save_summary(st.session_state.pdf_db_id, summary)
+            if quiz:
+                st.session_state.quiz_data = quiz
+                st.session_state.user_answers = {}
+                st.session_state.quiz_submitted = False
+                save_quiz(st.session_state.pdf_db_id, quiz)
+            if summary and quiz:
+                st.rerun()
+            if summary:
+                st.markdown(f'<div class="stCard"><h3>Summary</h3><p>{st.session_state.summary_text}</p></div>', unsafe_allow_html=True)
+            else:
+                st.error("Failed to generate summary.")
+            if not quiz:
+                st.error("Failed to generate quiz. Please try again from the 'Quiz Generator' tab.")
         elif not st.session_state.pdf_db_id:
             st.info("Please upload a PDF file from the sidebar to get started.")
 
@@ -240,9 +367,7 @@ with tab_quiz:
     # Load existing quiz
     existing_quiz = None
     if st.session_state.pdf_db_id:
-        conn = connect_db()
-        existing_quiz = get_quiz(conn, st.session_state.pdf_db_id)
-        conn.close()
+        existing_quiz = load_quiz(st.session_state.pdf_db_id)
         if existing_quiz:
             st.session_state.quiz_data = existing_quiz['quiz_data']
             st.info("Loaded previous quiz from database.")
@@ -250,50 +375,55 @@ with tab_quiz:
     if st.session_state.summary_text:  # Only allow quiz if summary exists
         if st.session_state.quiz_data:
             st.subheader("Answer the Quiz Questions")
-            # Display MCQs
-            total_questions = len(st.session_state.quiz_data.get('mcqs', [])) + \
-                              len(st.session_state.quiz_data.get('mixed_questions', []))
-
-            for i, mcq in enumerate(st.session_state.quiz_data.get('mcqs', [])):
-                st.markdown(f'<div class="stCard"><h4>Question {i+1}: {mcq["question"]}</h4>', unsafe_allow_html=True)
-                options_display = [opt for opt in mcq["options"]]
-                user_choice = st.radio(
-                    "Select your answer:",
-                    options_display,
-                    key=f"mcq_{i}",
-                    index=None,
-                    disabled=st.session_state.quiz_submitted
-                )
-                if user_choice:
-                    st.session_state.user_answers[f"mcq_{i}"] = user_choice
-                st.markdown('</div>', unsafe_allow_html=True)
-
-            # Display Mixed Questions
-            mcq_count = len(st.session_state.quiz_data.get('mcqs', []))
-            for i, mixed_q in enumerate(st.session_state.quiz_data.get('mixed_questions', [])):
-                q_num = mcq_count + i + 1
-                st.markdown(f'<div class="stCard"><h4>Question {q_num}: {mixed_q["question"]}</h4>', unsafe_allow_html=True)
-                if mixed_q["type"] == "true_false":
-                    user_tf_choice = st.radio(
-                        "Select True or False:",
-                        ["True", "False"],
-                        key=f"mixed_{i}",
+            # Widgets inside a form only send their values when the form is submitted,
+            # so answering questions does not rerun the script; "Check Answers" does once.
+            with st.form("quiz_form"):
+                # Display MCQs
+                total_questions = len(st.session_state.quiz_data.get('mcqs', [])) + \
+                                  len(st.session_state.quiz_data.get('mixed_questions', []))
+
+                for i, mcq in enumerate(st.session_state.quiz_data.get('mcqs', [])):
+                    st.markdown(f'<div class="stCard"><h4>Question {i+1}: {mcq["question"]}</h4>', unsafe_allow_html=True)
+                    options_display = [opt for opt in mcq["options"]]
+                    user_choice = st.radio(
+                        "Select your answer:",
+                        options_display,
+                        key=f"mcq_{i}",
                         index=None,
                         disabled=st.session_state.quiz_submitted
                     )
-                    if user_tf_choice:
-                        st.session_state.user_answers[f"mixed_{i}"] = user_tf_choice
-                elif mixed_q["type"] == "fill_in_the_blank":
-                    user_fill_answer = st.text_input(
-                        "Fill in the blank:",
-                        key=f"mixed_{i}",
-                        disabled=st.session_state.quiz_submitted
-                    )
-                    if user_fill_answer:
-                        st.session_state.user_answers[f"mixed_{i}"] = user_fill_answer
-                st.markdown('</div>', unsafe_allow_html=True)
+                    if user_choice:
+                        st.session_state.user_answers[f"mcq_{i}"] = user_choice
+                    st.markdown('</div>', unsafe_allow_html=True)
 
-            if st.button("Check Answers", disabled=st.session_state.quiz_submitted):
+                # Display Mixed Questions
+                mcq_count = len(st.session_state.quiz_data.get('mcqs', []))
+                for i, mixed_q in enumerate(st.session_state.quiz_data.get('mixed_questions', [])):
+                    q_num = mcq_count + i + 1
+                    st.markdown(f'<div class="stCard"><h4>Question {q_num}: {mixed_q["question"]}</h4>', unsafe_allow_html=True)
+                    if mixed_q["type"] == "true_false":
+                        user_tf_choice = st.radio(
+                            "Select True or False:",
+                            ["True", "False"],
+                            key=f"mixed_{i}",
+                            index=None,
+                            disabled=st.session_state.quiz_submitted
+                        )
+                        if user_tf_choice:
+                            st.session_state.user_answers[f"mixed_{i}"] = user_tf_choice
+                    elif mixed_q["type"] == "fill_in_the_blank":
+                        user_fill_answer = st.text_input(
+                            "Fill in the blank:",
+                            key=f"mixed_{i}",
+                            disabled=st.session_state.quiz_submitted
+                        )
+                        if user_fill_answer:
+                            st.session_state.user_answers[f"mixed_{i}"] = user_fill_answer
+                    st.markdown('</div>', unsafe_allow_html=True)
+
+                check_answers = st.form_submit_button("Check Answers", disabled=st.session_state.quiz_submitted)
+
+            if check_answers:
                 st.session_state.quiz_submitted = True
                 score = 0
                 results = []
@@ -329,24 +459,33 @@ with tab_quiz:
                                 f'<p>Correct Answer: <span class="score-correct">{res["correct_answer"]}</span></p></div>', unsafe_allow_html=True)
 
                 # Save quiz attempt
-                conn = connect_db()
-                quiz_record = get_quiz(conn, st.session_state.pdf_db_id)
+                quiz_record = load_quiz(st.session_state.pdf_db_id)
                 if quiz_record:
-                    insert_quiz_attempt(conn, quiz_record['id'], st.session_state.user_answers, score)
-                    st.success("Quiz attempt saved to database!")
-                conn.close()
+                    try:
+                        save_quiz_attempt(quiz_record, dict(st.session_state.user_answers), score)
+                        st.success("Quiz attempt queued for saving to the database.")
+                    except Exception as e:
+                        print(f"Error saving quiz attempt: {e}")
+                        st.error("Failed to save quiz attempt.")
 
         else:  # No quiz yet, show "Create Quiz" button
+            quiz_source_labels = {
+                "full": "Full PDF text",
+                "summary": "Summary only (fastest)",
+                "summary_passages": "Summary + key passages",
+            }
+            quiz_source = st.selectbox("Generate quiz from:", list(quiz_source_labels),
+                                       format_func=quiz_source_labels.get, index=2)
             if st.button("Create Quiz"):
                 with st.spinner("Generating quiz using Gemini... This may take a moment."):
-                    quiz = study_agent.generate_quiz(st.session_state.pdf_text_content)
+                    quiz_material = study_agent.quiz_source_text(st.session_state.pdf_text_content,
+                                                                 st.session_state.summary_text, quiz_source)
+                    quiz = study_agent.generate_quiz(quiz_material)
                     if quiz:
                         st.session_state.quiz_data = quiz
                         st.session_state.user_answers = {}
                         st.session_state.quiz_submitted = False
-                        conn = connect_db()
-                        insert_quiz(conn, st.session_state.pdf_db_id, quiz)
-                        conn.close()
+                        save_quiz(st.session_state.pdf_db_id, quiz, source=quiz_source)
                         st.rerun()
                     else:
                         st.error("Failed to generate quiz. Please try again.")
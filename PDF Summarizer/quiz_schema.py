@@ -0,0 +1,184 @@
+import json
+
+# Response schema for structured quiz output, in the OpenAPI subset accepted by
+# Gemini's `response_schema` generation setting.
+MCQ_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "question": {"type": "STRING"},
+        "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "correct_answer": {"type": "STRING", "format": "enum", "enum": ["A", "B", "C", "D"]},
+    },
+    "required": ["question", "options", "correct_answer"],
+}
+
+MIXED_QUESTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "type": {"type": "STRING", "format": "enum", "enum": ["true_false", "fill_in_the_blank"]},
+        "question": {"type": "STRING"},
+        "correct_answer": {"type": "STRING"},
+    },
+    "required": ["type", "question", "correct_answer"],
+}
+
+QUIZ_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "mcqs": {"type": "ARRAY", "items": MCQ_SCHEMA},
+        "mixed_questions": {"type": "ARRAY", "items": MIXED_QUESTION_SCHEMA},
+    },
+    "required": ["mcqs", "mixed_questions"],
+}
+
+# Schemas for generating one section of the quiz per call
+MCQ_SECTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"mcqs": {"type": "ARRAY", "items": MCQ_SCHEMA}},
+    "required": ["mcqs"],
+}
+
+MIXED_SECTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"mixed_questions": {"type": "ARRAY", "items": MIXED_QUESTION_SCHEMA}},
+    "required": ["mixed_questions"],
+}
+
+MIXED_QUESTION_TYPES = ("true_false", "fill_in_the_blank")
+
+def strip_code_fences(text):
+    """Removes a markdown ```json ... ``` wrapper that models sometimes add."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text[3:]
+        if text.startswith("json"):
+            text = text[len("json"):]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+def repair_json(text):
+    """
+    Best-effort repair of sloppy or truncated JSON: drops trailing commas, ignores
+    anything after the top-level value, and closes a truncated document at the
+    last complete element. The result may still be invalid JSON.
+    """
+    start = min((i for i in (text.find('{'), text.find('[')) if i != -1), default=-1)
+    if start == -1:
+        return text
+    out = []
+    stack = []
+    in_string = escaped = False
+    # Output length and open containers at the last point where everything before is complete
+    safe_length, safe_stack = 0, []
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+            out.append(ch)
+            safe_length, safe_stack = len(out), list(stack)
+        elif ch in '}]':
+            if not stack or stack[-1] != ch:
+                break
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            stack.pop()
+            out.append(ch)
+            safe_length, safe_stack = len(out), list(stack)
+            if not stack:
+                break
+        elif ch == ',':
+            safe_length, safe_stack = len(out), list(stack)
+            out.append(ch)
+        else:
+            out.append(ch)
+    if not stack:
+        return ''.join(out)
+    return ''.join(out[:safe_length]).rstrip().rstrip(',') + ''.join(reversed(safe_stack))
+
+def _is_text(value):
+    return isinstance(value, str) and value.strip() != ""
+
+def _valid_mcq(mcq):
+    if not isinstance(mcq, dict) or not _is_text(mcq.get("question")):
+        return False
+    options = mcq.get("options")
+    if not isinstance(options, list) or len(options) < 2 or not all(_is_text(opt) for opt in options):
+        return False
+    answer = mcq.get("correct_answer")
+    return isinstance(answer, str) and len(answer.strip()) == 1 and answer.strip() in "ABCD"[:len(options)]
+
+def _normalize_mixed_question(question):
+    """Returns a cleaned copy of a mixed question, or None if it is unusable."""
+    if not isinstance(question, dict) or question.get("type") not in MIXED_QUESTION_TYPES:
+        return None
+    if not _is_text(question.get("question")):
+        return None
+    answer = question.get("correct_answer")
+    if question["type"] == "true_false":
+        if isinstance(answer, bool):
+            answer = "True" if answer else "False"
+        if not isinstance(answer, str) or answer.strip().lower() not in ("true", "false"):
+            return None
+        answer = answer.strip().capitalize()
+    elif not _is_text(answer):
+        return None
+    return {**question, "correct_answer": answer}
+
+def check_quiz(quiz_data):
+    """
+    Keeps the well-formed questions of a quiz and drops the rest (e.g. the last
+    question of a truncated response). Returns (quiz, complete), where `complete`
+    is False if anything was dropped or a section was missing.
+    Raises ValueError if nothing usable is left.
+    """
+    if not isinstance(quiz_data, dict):
+        raise ValueError("Quiz data is not a JSON object.")
+    complete = isinstance(quiz_data.get("mcqs"), list) and isinstance(quiz_data.get("mixed_questions"), list)
+    mcqs = quiz_data.get("mcqs") if isinstance(quiz_data.get("mcqs"), list) else []
+    mixed_questions = quiz_data.get("mixed_questions") if isinstance(quiz_data.get("mixed_questions"), list) else []
+    valid_mcqs = [mcq for mcq in mcqs if _valid_mcq(mcq)]
+    valid_mixed = [q for q in map(_normalize_mixed_question, mixed_questions) if q is not None]
+    if not valid_mcqs and not valid_mixed:
+        raise ValueError("Quiz data contains no valid 'mcqs' or 'mixed_questions'.")
+    complete = complete and len(valid_mcqs) == len(mcqs) and len(valid_mixed) == len(mixed_questions)
+    return {"mcqs": valid_mcqs, "mixed_questions": valid_mixed}, complete
+
+def parse_quiz_response(response_text):
+    """
+    Parses and validates a quiz returned by the model, repairing and salvaging
+    partially valid output instead of rejecting it. Returns (quiz, complete), where
+    `complete` is False if the JSON needed repair or questions were dropped; such
+    salvaged quizzes are usable but should not be cached as the model's answer.
+    Raises json.JSONDecodeError if the text cannot be parsed even after repair, or
+    ValueError if it holds no usable questions.
+    """
+    quiz_json_str = strip_code_fences(response_text)
+    repaired = False
+    try:
+        quiz_data = json.loads(quiz_json_str)
+    except json.JSONDecodeError as e:
+        try:
+            quiz_data = json.loads(repair_json(quiz_json_str))
+        except json.JSONDecodeError:
+            raise e
+        repaired = True
+    quiz, complete = check_quiz(quiz_data)
+    return quiz, complete and not repaired
+
+def parse_quiz(response_text):
+    """Parses, repairs and validates a quiz returned by the model (see parse_quiz_response)."""
+    return parse_quiz_response(response_text)[0]
@@ -0,0 +1,190 @@
+import os
+import time
+import random
+import asyncio
+import threading
+
+# Client-side limits for Gemini API calls. Override them with environment variables
+# to match the quota of the API key in use.
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "1000000"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+# Retry policy: exponential backoff with full jitter, capped at RETRY_MAX_DELAY seconds
+DEFAULT_MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# HTTP status codes worth retrying; 429 also means we are being throttled
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+THROTTLED_STATUS_CODE = 429
+
+# How long a caller waits before re-checking for a free concurrency slot
+SLOT_POLL_INTERVAL = 0.05
+
+def is_throttled(error):
+    """Returns True if the error means the API rejected the call for exceeding the quota."""
+    return getattr(error, 'code', None) == THROTTLED_STATUS_CODE
+
+def is_retryable(error):
+    """Returns True for throttling, transient server errors, timeouts and connection failures."""
+    return (getattr(error, 'code', None) in RETRYABLE_STATUS_CODES
+            or isinstance(error, (TimeoutError, ConnectionError)))
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at `rate_per_second` up to `capacity`.
+    Not thread-safe on its own; AdaptiveRateLimiter guards it with its lock.
+    """
+    def __init__(self, rate_per_second, capacity):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.available = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` (capped at the capacity) can be taken; 0 if available now."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing / self.rate_per_second)
+
+    def take(self, amount):
+        self.available -= min(amount, self.capacity)
+
+class AdaptiveRateLimiter:
+    """
+    Shared limiter for model calls. Each call takes one request and its estimated
+    tokens from two token buckets, and holds one of a limited number of concurrency
+    slots. Concurrency adapts AIMD style: every successful call raises the limit by
+    about one slot per window of calls, and every throttled (429) call halves it.
+    Retryable failures are retried with jittered exponential backoff.
+    Works for threads and asyncio tasks alike.
+    """
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, min_concurrency=1, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.request_bucket = TokenBucket(requests_per_minute / 60.0, requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens):
+        """Takes a slot and budget for one call if possible; otherwise returns how long to wait."""
+        with self._lock:
+            if self.in_flight >= int(self.concurrency_limit):
+                return SLOT_POLL_INTERVAL
+            now = time.monotonic()
+            wait = max(self.request_bucket.wait_time(1, now), self.token_bucket.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+            self.request_bucket.take(1)
+            self.token_bucket.take(tokens)
+            self.in_flight += 1
+            return 0
+
+    def acquire(self, tokens=0):
+        """Blocks until a call with `tokens` estimated tokens may start."""
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=0):
+        """Waits without blocking the event loop until a call may start."""
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, throttled=False):
+        """Frees a slot and adapts the concurrency limit to the outcome of the call."""
+        with self._lock:
+            self.in_flight -= 1
+            if throttled:
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+            else:
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+
+    def backoff_delay(self, attempt):
+        """Jittered exponential delay before retry number `attempt` (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _should_retry(self, error, attempt):
+        return attempt < self.max_retries and is_retryable(error)
+
+    def call(self, fn, *args, tokens=0, **kwargs):
+        """Calls `fn(*args, **kwargs)` within the limits, retrying retryable failures."""
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.release(throttled=is_throttled(e))
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+                attempt += 1
+                continue
+            self.release()
+            return result
+
+    async def call_async(self, fn, *args, tokens=0, **kwargs):
+        """Awaits `fn(*args, **kwargs)` within the limits, retrying retryable failures."""
+        attempt = 0
+        while True:
+            await self.acquire_async(tokens)
+            try:
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                self.release()
+                raise
+            except Exception as e:
+                self.release(throttled=is_throttled(e))
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self.backoff_delay(attempt))
+                attempt += 1
+                continue
+            self.release()
+            return result
+
+    def stream(self, fn, *args, tokens=0, **kwargs):
+        """
+        Yields from the iterator returned by `fn(*args, **kwargs)` while holding a slot.
+        Failures are retried only until the first item is yielded; after that the
+        partial output has reached the caller and the error is raised.
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            started = False
+            throttled = False
+            try:
+                for item in fn(*args, **kwargs):
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                throttled = is_throttled(e)
+                if started or not self._should_retry(e, attempt):
+                    raise
+            finally:
+                self.release(throttled=throttled)
+            time.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+# Process-wide limiter shared by all agents, so concurrent sessions respect one quota
+default_rate_limiter = AdaptiveRateLimiter()